@@ -1,93 +1,66 @@
-import os
-import pkg_resources
-import zipfile
-import site
 from itertools import combinations_with_replacement
 
+from .phonetics import ipa_vowels, get_rhyme, get_meter, get_word_meter, phonemes, rhyme_distance
+from .lexicon import get_lexicon, LexiconView
+from .g2p import guess_entries, guess_ipa, rule_ipa, split_compound, oov_cache_info, clear_oov_cache
+from .scansion import tokenize, scan_corpus
+from .parallel import process_corpus, map_chunks
+from .rhyme_index import near_rhymes
+from .meter_index import find_words, matching_meters, pattern_words
+from .instrumentation import enable_stats, disable_stats, reset_stats, get_stats
+from .overlay import add_entry, remove_entry, load_overlay, save_overlay, clear_overlay
+
 # Load data
-archive = zipfile.ZipFile(site.getsitepackages()[-1]+"\\GERpronouncing\\data\\de_ipa_wiktionary.zip", 'r')
+# The lexicon is compiled into a memory-mapped snapshot (see lexicon.py), which is only opened on the
+# first lookup. If the snapshot is missing or outdated it is rebuilt once from de_ipa_wiktionary.zip
+# (this takes a few seconds, afterwards importing GERpronouncing is almost instantaneous).
+# To build the snapshot in advance run: python -m GERpronouncing.build
 
-with archive.open("de_ipa_wiktionary.csv") as csvfile:
-    wiki_read = csvfile.read().decode('utf-8')
-    wiki_rows = [row.split(",") for row in wiki_read.split("\n")[1:-1] if len(row.split(",")) == 4]
-    archive.close()
+# Dictionaries for easier access (resolved lazily from the lexicon)
+words_dict = LexiconView("word")
+rhymes_dict = LexiconView("rhyme")
+syllables_dict = LexiconView("syllables")
+meters_dict = LexiconView("meter")
+forms_dict = LexiconView("lemma")
 
-ipa_vowels = ['o','u','i','a','ə','ɐ','ɪ','ʏ','ʊ','e','ɛ','ø','ɔ','œ','y','ɑ','æ','ɯ','ɒ','ε','ɘ','I','U','ɜ','ɝ','ı','ɵ','ʌ','ɨ','õ','ā']
 
+# wiki_rows is only created when it is accessed, since the functions do not need it anymore
+def __getattr__(name):
+    if name == "wiki_rows":
+        rows = [list(row) for row in get_lexicon().rows()]
+        globals()["wiki_rows"] = rows
+        return rows
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-# function to identify the rhyme of a given ipa-word
-def get_rhyme(ipa_word):
-    rhyme = ipa_word
-    # for words with more syllables identify the main stress part of the word
-    # and cut off the rest
-    if "ˈ" in rhyme:
-        while rhyme[0] != "ˈ":
-            rhyme = rhyme[1:]
-        rhyme = rhyme[1:]
-    # cut off all consonants until the next vowel
-    for i in rhyme:
-        if i not in ipa_vowels:
-            rhyme = rhyme[1:]
-        else:
-            break
-    return rhyme
 
-# function to identify the meter of a given ipa-word
-def get_meter(ipa_word):
-    vowels = []
-    string = ""
-    for index,letter in enumerate(ipa_word):
-        if letter in ["ˌ","ˈ",'̯']:
-            string += letter
-        if letter in ipa_vowels+['̩','̍'] and index != len(ipa_word)-1:
-            string += letter
-            if ipa_word[index+1] != '̯':
-                vowels.append(string)
-                string = ""
-        if letter in ipa_vowels+['̩','̍'] and index == len(ipa_word)-1:
-            string += letter
-            vowels.append(string)
-    meter = ""
-    for vowel in vowels:
-        if "ˈ" in vowel:
-            meter += "1"
-        elif "ˌ" in vowel:
-            meter += "2"
-        else:
-            meter += "0"
-    return meter
+# The drop_wiki_rows function frees the memory of wiki_rows after it was accessed
+# (it will be created again on the next access)
+def drop_wiki_rows():
+    globals().pop("wiki_rows", None)
 
-# Create dictionaries for easier access
-# (This takes a few seconds when GERpronouncing is imported, but improves performance afterwards)
-words_dict = {}
-rhymes_dict = {}
-syllables_dict = {}
-meters_dict = {}
 
-for word, lemma, ipa, meter in wiki_rows:
-    rhyme = get_rhyme(ipa)
-    syllables = len(meter)
-    
-    if word not in words_dict:
-        words_dict[word] = [{"lemma":lemma,"ipa":ipa,"rhyme":rhyme,"syllables":syllables,"meter":meter}]
-    else:
-        words_dict[word] += [{"lemma":lemma,"ipa":ipa,"rhyme":rhyme,"syllables":syllables,"meter":meter}]
-        
-    if rhyme not in rhymes_dict:
-        rhymes_dict[rhyme] = [word]
-    else:
-        rhymes_dict[rhyme] += [word]
-        
-    if meter not in meters_dict:
-        meters_dict[meter] = [word]
-    else:
-        meters_dict[meter] += [word]
-        
-    if syllables not in syllables_dict:
-        syllables_dict[syllables] = [word]
-    else:
-        syllables_dict[syllables] += [word]
-        
+# shared implementation of ipa, rhyme, count_syllables and meter
+# returns the attribute "field" of the entries of a word, filtered by lemma and variation
+# (with fallback=True the entries of unknown words are guessed, see g2p.py)
+def _lookup(field, word, lemma, variation, fallback=False):
+    entries = guess_entries(word) if fallback else get_lexicon().entries(word)
+    if entries is None:
+        return [] if variation == "all" else ""
+    if lemma == "" or lemma not in [entry.lemma for entry in entries]:
+        if variation != "all":
+            try:
+                return getattr(entries[variation], field)
+            except (IndexError, TypeError):
+                return ""
+        lemma = entries[0].lemma
+    values = list(dict.fromkeys([getattr(entry, field) for entry in entries if entry.lemma == lemma]))
+    if variation == "all":
+        return values
+    try:
+        return values[variation]
+    except (IndexError, TypeError):
+        return ""
+
 
 ########################################################################################
 # lemmas
@@ -97,19 +70,31 @@ for word, lemma, ipa, meter in wiki_rows:
 # input: word (string)
 # output: list of lemmas (list)
 def lemmas(word):
-    try:
-        return list(dict.fromkeys([minidict["lemma"] for minidict in words_dict[word]]))
-    except:
+    entries = get_lexicon().entries(word)
+    if entries is None:
         return []
+    return list(dict.fromkeys([entry.lemma for entry in entries]))
     
 # The possible_forms_of function returns a list of possible forms of a given lemma.
 # input: lemma (string)
 # output: forms of the given lemma (list)
 def possible_forms_of(lemma):
-    try:
-        return [word[0] for word in wiki_rows if word[1] == lemma]
-    except:
-        return []
+    forms = get_lexicon().words_by("lemma", lemma)
+    return [] if forms is None else forms
+
+forms_of = possible_forms_of
+
+# The forms_of_many function returns the possible forms of several lemmas at once
+# input: lemmas (iterable of strings)
+# output: forms of every given lemma (dictionary: lemma -> list)
+def forms_of_many(lemmas):
+    lexicon = get_lexicon()
+    result = {}
+    for lemma in lemmas:
+        if lemma not in result:
+            forms = lexicon.words_by("lemma", lemma)
+            result[lemma] = [] if forms is None else forms
+    return result
     
 ########################################################################################
 # ipa
@@ -120,50 +105,21 @@ def possible_forms_of(lemma):
 # Since some words have multiple pronouncation variations, the variation can be chosen by setting the
 # "variation" argument with an integer. To get a list of all variations the "variation" argument can be set with
 # the string "all".
-# input: word (string), lemma (string), variation (integer or string ("all"))
+# With fallback=True the ipa code of words missing in the lexicon is guessed (compound splitting or spelling rules).
+# input: word (string), lemma (string), variation (integer or string ("all")), fallback (boolean)
 # output: ipa code (string/list)
-def ipa(word,lemma = "",variation=0):
-    try:
-        if variation == "all":
-            if lemma == "" or lemma not in lemmas(word):
-                return list(dict.fromkeys([minidict["ipa"] for minidict in words_dict[word] if minidict["lemma"] == words_dict[word][0]["lemma"]]))
-            else:
-                return list(dict.fromkeys([minidict["ipa"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))
-        else:
-            if lemma == "" or lemma not in lemmas(word):
-                return words_dict[word][variation]["ipa"]
-            else:
-                return list(dict.fromkeys([minidict["ipa"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))[variation]
-    except:
-        if variation != "all":
-            return ""
-        else:
-            return []
+def ipa(word,lemma = "",variation=0,fallback=False):
+    return _lookup("ipa", word, lemma, variation, fallback)
         
 ########################################################################################
 # rhyme
 ########################################################################################
     
 # the rhyme function returns the rhyme in ipa code of a given word
-# input: word (string), lemma (string), variation (integer or string ("all"))
+# input: word (string), lemma (string), variation (integer or string ("all")), fallback (boolean)
 # output: rhyme/rhyme variations (string/list)
-def rhyme(word,lemma = "",variation=0):
-    try:
-        if variation == "all":
-            if lemma == "" or lemma not in lemmas(word):
-                return list(dict.fromkeys([minidict["rhyme"] for minidict in words_dict[word] if minidict["lemma"] == words_dict[word][0]["lemma"]]))
-            else:
-                return list(dict.fromkeys([minidict["rhyme"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))
-        else:
-            if lemma == "" or lemma not in lemmas(word):
-                return words_dict[word][variation]["rhyme"]
-            else:
-                return list(dict.fromkeys([minidict["rhyme"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))[variation]
-    except:
-        if variation != "all":
-            return ""
-        else:
-            return []
+def rhyme(word,lemma = "",variation=0,fallback=False):
+    return _lookup("rhyme", word, lemma, variation, fallback)
         
 # the rhymes function returns a list of words, that rhyme with a given word
 # input: word (string), lemma (string), variation (integer or string ("all"))
@@ -183,25 +139,10 @@ def rhymes(word,lemma = "",variation=0):
 ########################################################################################
     
 # the count_syllables function returns the number of syllables a given word contains
-# input: word (string), lemma (string), variation (integer or string ("all"))
+# input: word (string), lemma (string), variation (integer or string ("all")), fallback (boolean)
 # output: number of syllables/list of all possible syllable variations (integer/list)
-def count_syllables(word,lemma = "",variation=0):
-    try:
-        if variation == "all":
-            if lemma == "" or lemma not in lemmas(word):
-                return list(dict.fromkeys([minidict["syllables"] for minidict in words_dict[word] if minidict["lemma"] == words_dict[word][0]["lemma"]]))
-            else:
-                return list(dict.fromkeys([minidict["syllables"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))
-        else:
-            if lemma == "" or lemma not in lemmas(word):
-                return words_dict[word][variation]["syllables"]
-            else:
-                return list(dict.fromkeys([minidict["syllables"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))[variation]
-    except:
-        if variation != "all":
-            return ""
-        else:
-            return []
+def count_syllables(word,lemma = "",variation=0,fallback=False):
+    return _lookup("syllables", word, lemma, variation, fallback)
         
 # the same_syllables function returns a list of words, consisting of the same number of syllables as a given word
 # input: word (string), lemma (string), variation (integer)
@@ -226,25 +167,10 @@ def same_syllables(word,lemma = "",variation=0):
 ########################################################################################
 
 # The meter function simply returns the meter pattern of a given word
-# input: word (string), lemma (string), variation (integer)
+# input: word (string), lemma (string), variation (integer), fallback (boolean)
 # output: peter pattern (string)
-def meter(word,lemma = "",variation=0):
-    try:
-        if variation == "all":
-            if lemma == "" or lemma not in lemmas(word):
-                return list(dict.fromkeys([minidict["meter"] for minidict in words_dict[word] if minidict["lemma"] == words_dict[word][0]["lemma"]]))
-            else:
-                return list(dict.fromkeys([minidict["meter"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))
-        else:
-            if lemma == "" or lemma not in lemmas(word):
-                return words_dict[word][variation]["meter"]
-            else:
-                return list(dict.fromkeys([minidict["meter"] for minidict in words_dict[word] if minidict["lemma"] == lemma]))[variation]
-    except:
-        if variation != "all":
-            return ""
-        else:
-            return []
+def meter(word,lemma = "",variation=0,fallback=False):
+    return _lookup("meter", word, lemma, variation, fallback)
         
 # The meters function returns a list of words following the same meter pattern of a given word
 # input: word (string), lemma (string), variation (integer)
@@ -260,11 +186,75 @@ def meters(word,lemma = "",variation=0):
         return []
     
 # The meters_like function returns a list of words following the same meter pattern of a given pattern (i.e "10002")
-# input: pattern (string)
+# The pattern may contain wildcards ("?" for any syllable, "*" for any number of syllables, i.e. "*10" or "1?0?").
+# With levels=False secondary stress (2) is treated like primary stress (1). A word is returned once per matching
+# entry, in lexicon order, so pages of limit/offset are the same with and without wildcards.
+# See meter_index.find_words for prefix, suffix, syllable count and rhyme constraints.
+# input: pattern (string), levels (boolean), limit (integer or None), offset (integer)
 # output: list of words with the same meter pattern (list)
-def meters_like(meter_pattern,levels=True):
-    try:
-        #return list(dict.fromkeys([minidict["lemma"] for minidict in meters_dict[meter_pattern]]))
-        return [word for word in meters_dict[meter_pattern]]
-    except:
+def meters_like(meter_pattern,levels=True,limit=None,offset=0):
+    if not isinstance(meter_pattern, str):
         return []
+    return pattern_words(meter_pattern, levels, limit, offset)
+
+########################################################################################
+# batch
+# the following functions resolve a whole sequence of tokens at once (i.e. the tokens of a text)
+########################################################################################
+
+BATCH_FIELDS = ("ipa", "rhyme", "meter", "syllables")
+_BATCH_FIELDS = ("lemma",) + BATCH_FIELDS
+
+# The analyze_many function looks up several fields for a sequence of tokens in one pass.
+# Repeated tokens are only resolved once. The result is columnar: one list per field, aligned with the tokens.
+# Like the functions for single words, unknown tokens (or variations) get an empty string, unless fallback=True.
+# With as_array=True a NumPy structured array is returned instead (requires numpy, unknown syllable counts are -1).
+# input: tokens (iterable of strings), fields (tuple of strings), variation (integer, "all" is not supported),
+#        as_array (boolean), fallback (boolean)
+# output: columns (dictionary: field -> list) or structured array
+def analyze_many(tokens, fields=BATCH_FIELDS, variation=0, as_array=False, fallback=False):
+    tokens = tokens if isinstance(tokens, list) else list(tokens)
+    fields = tuple(fields)
+    for field in fields:
+        if field not in _BATCH_FIELDS:
+            raise ValueError("unknown field %r, choose from %s" % (field, ", ".join(_BATCH_FIELDS)))
+    if not isinstance(variation, int):
+        raise ValueError("analyze_many needs an integer variation, got %r" % (variation,))
+
+    lexicon = get_lexicon()
+    missing = ("",) * len(fields)
+    resolved = {}
+    for token in dict.fromkeys(tokens):
+        postings = lexicon.postings("word", token)
+        if postings is not None:
+            entry = lexicon.entry(postings[variation]) if -len(postings) <= variation < len(postings) else None
+        elif fallback:
+            entries = guess_entries(token)
+            entry = entries[variation] if entries and -len(entries) <= variation < len(entries) else None
+        else:
+            entry = None
+        resolved[token] = missing if entry is None else tuple([getattr(entry, field) for field in fields])
+
+    rows = [resolved[token] for token in tokens]
+    if as_array:
+        return _structured_array(rows, fields)
+    if not rows:
+        return {field: [] for field in fields}
+    return {field: list(column) for field, column in zip(fields, zip(*rows))}
+
+# NumPy is only needed for as_array=True, so it is imported here
+def _structured_array(rows, fields):
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("analyze_many(..., as_array=True) requires numpy")
+    dtype = []
+    for index, field in enumerate(fields):
+        if field == "syllables":
+            dtype.append((field, "i2"))
+        else:
+            dtype.append((field, "U%d" % max([len(row[index]) for row in rows] + [1])))
+    if "syllables" in fields:
+        index = fields.index("syllables")
+        rows = [row[:index] + (-1 if row[index] == "" else row[index],) + row[index + 1:] for row in rows]
+    return numpy.array(rows, dtype=dtype)
@@ -0,0 +1,24 @@
+# Compile the Wiktionary CSV into the binary lexicon snapshot, which is memory-mapped on import
+# usage: python -m GERpronouncing.build [--output PATH] [--source PATH]
+
+import argparse
+import time
+
+from .lexicon import build_snapshot, SOURCE_PATH
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m GERpronouncing.build",
+                                     description="compile de_ipa_wiktionary.zip into a lexicon snapshot")
+    parser.add_argument("--output", default=None,
+                        help="path of the snapshot (default: package data directory or ~/.cache/GERpronouncing)")
+    parser.add_argument("--source", default=SOURCE_PATH, help="path of de_ipa_wiktionary.zip")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    path = build_snapshot(args.output, args.source)
+    print("wrote %s in %.2fs" % (path, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
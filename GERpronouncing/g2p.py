@@ -0,0 +1,283 @@
+# Fallback pronounciations for out-of-vocabulary words
+#
+# Words missing in the lexicon (compounds, new coinages, lowercase sentence-initial nouns, ...) are resolved by
+#   1. looking up the word with a different capitalization ("haus" -> "Haus")
+#   2. splitting it into known words, optionally joined by a linking element ("Arbeit-s-zimmer")
+#   3. a rule-based grapheme-to-phoneme conversion
+# The results are kept in a bounded LRU cache, so repeated unknown tokens of a corpus are only resolved once.
+
+from functools import lru_cache
+
+from .phonetics import get_rhyme, get_word_meter
+from .lexicon import get_lexicon, Entry
+
+OOV_CACHE_SIZE = 65536
+MIN_PART_LENGTH = 3
+
+# linking elements between the parts of compounds and their ipa
+_LINKERS = (("", ""), ("s", "s"), ("es", "əs"), ("n", "n"), ("en", "ən"), ("e", "ə"), ("er", "ɐ"))
+
+########################################################################################
+# rule-based grapheme-to-phoneme conversion
+########################################################################################
+
+# grapheme units, longest match first: (graphemes, ipa, is_vowel)
+# None as ipa marks units which depend on their context (see rule_ipa)
+_UNITS = sorted([
+    ("tsch", "t͡ʃ", False), ("sch", "ʃ", False), ("chs", "ks", False), ("ch", None, False), ("ck", "k", False),
+    ("ph", "f", False), ("qu", "kv", False), ("th", "t", False), ("ng", "ŋ", False), ("tz", "t͡s", False),
+    ("dt", "t", False), ("ss", "s", False), ("ß", "s", False), ("pf", "p͡f", False),
+    # doubled consonants are one phone, their two letters still shorten the vowel before them
+    ("bb", "b", False), ("dd", "d", False), ("ff", "f", False), ("gg", "ɡ", False), ("ll", "l", False),
+    ("mm", "m", False), ("nn", "n", False), ("pp", "p", False), ("rr", "ʁ", False), ("tt", "t", False),
+    ("ei", "aɪ̯", True), ("ai", "aɪ̯", True), ("ey", "aɪ̯", True), ("ay", "aɪ̯", True), ("eu", "ɔʏ̯", True),
+    ("äu", "ɔʏ̯", True), ("au", "aʊ̯", True), ("ie", "iː", True), ("aa", "aː", True), ("ee", "eː", True),
+    ("oo", "oː", True), ("ah", "aː", True), ("eh", "eː", True), ("ih", "iː", True), ("oh", "oː", True),
+    ("uh", "uː", True), ("äh", "ɛː", True), ("öh", "øː", True), ("üh", "yː", True),
+    ("a", None, True), ("e", None, True), ("i", None, True), ("o", None, True), ("u", None, True),
+    ("ä", None, True), ("ö", None, True), ("ü", None, True), ("y", None, True),
+    ("b", "b", False), ("c", "k", False), ("d", "d", False), ("f", "f", False), ("g", "ɡ", False),
+    ("h", "h", False), ("j", "j", False), ("k", "k", False), ("l", "l", False), ("m", "m", False),
+    ("n", "n", False), ("p", "p", False), ("r", "ʁ", False), ("s", None, False), ("t", "t", False),
+    ("v", "f", False), ("w", "v", False), ("x", "ks", False), ("z", "t͡s", False),
+], key=lambda unit: -len(unit[0]))
+
+# (long, short) realisation of single vowel letters
+_VOWELS = {"a": ("aː", "a"), "e": ("eː", "ɛ"), "i": ("iː", "ɪ"), "o": ("oː", "ɔ"), "u": ("uː", "ʊ"),
+           "ä": ("ɛː", "ɛ"), "ö": ("øː", "œ"), "ü": ("yː", "ʏ"), "y": ("yː", "ʏ")}
+_DEVOICED = {"b": "p", "d": "t", "ɡ": "k", "v": "f", "z": "s"}
+_ONSET_CLUSTERS = {("ʃ", "t"), ("ʃ", "p"), ("ʃ", "ʁ"), ("ʃ", "l"), ("ʃ", "m"), ("ʃ", "n"), ("ʃ", "v"),
+                   ("p", "l"), ("p", "ʁ"), ("b", "l"), ("b", "ʁ"), ("t", "ʁ"), ("d", "ʁ"), ("k", "l"),
+                   ("k", "ʁ"), ("ɡ", "l"), ("ɡ", "ʁ"), ("f", "l"), ("f", "ʁ")}
+_UNSTRESSED_PREFIXES = ("be", "ge", "er", "ver", "zer", "ent", "emp")
+_STRESSED_SUFFIXES = ("ieren", "ierung", "tion", "tät", "ei", "ist", "ur")
+
+
+# split a lowercase word into grapheme units
+def _units(word):
+    units = []
+    position = 0
+    while position < len(word):
+        for graphemes, ipa, is_vowel in _UNITS:
+            if word.startswith(graphemes, position):
+                units.append([graphemes, ipa, is_vowel])
+                position += len(graphemes)
+                break
+        else:
+            # letters without a rule (digits, hyphens, foreign letters) are dropped
+            position += 1
+    return units
+
+
+# index of the vowel unit carrying the main stress
+# nuclei: (character offset, graphemes) of every vowel unit
+def _stressed(word, nuclei):
+    if len(nuclei) < 2:
+        return 0
+    offsets = [offset for offset, graphemes in nuclei]
+    for suffix in _STRESSED_SUFFIXES:
+        if word.endswith(suffix) and len(word) > len(suffix) + 1:
+            in_suffix = [index for index, offset in enumerate(offsets) if offset >= len(word) - len(suffix)]
+            if in_suffix:
+                return in_suffix[-1] if suffix == "tion" else in_suffix[0]
+    for prefix in _UNSTRESSED_PREFIXES:
+        if word.startswith(prefix) and len(word) > len(prefix) + 2 and word[len(prefix)] not in "aeiouäöüyh":
+            # the rest of the word needs a full syllable: a final "e" (-e, -en, -ern, ...) is a schwa,
+            # so "erste", "Ernte" or "Gestern" are stressed on the first syllable
+            rest = nuclei[1:]
+            if any(graphemes != "e" for offset, graphemes in rest) or len(rest) > 1:
+                return 1
+            break
+    return 0
+
+
+# The rule_ipa function converts a word into ipa code with a few German spelling rules
+# (vowel length by the following consonants, final devoicing, schwa in unstressed syllables, stress on the
+# first syllable unless the word starts with an unstressed prefix or ends with a stressed suffix)
+# input: word (string)
+# output: ipa code (string)
+def rule_ipa(word):
+    word = word.lower()
+    units = _units(word)
+    vowel_units = [index for index, unit in enumerate(units) if unit[2]]
+    if not vowel_units:
+        return "".join(unit[1] or unit[0] for unit in units)
+
+    # character offsets of the vowel units (used for suffix detection)
+    offsets = []
+    position = 0
+    for unit in units:
+        offsets.append(position)
+        position += len(unit[0])
+    stressed = vowel_units[_stressed(word, [(offsets[index], units[index][0]) for index in vowel_units])]
+    # a word-final "e" is never stressed
+    if stressed == len(units) - 1 and units[stressed][0] == "e" and len(vowel_units) > 1:
+        stressed = vowel_units[vowel_units.index(stressed) - 1]
+
+    phones = []
+    for index, (graphemes, ipa, is_vowel) in enumerate(units):
+        previous = units[index - 1] if index > 0 else None
+        following = units[index + 1:]
+        if is_vowel:
+            if ipa is None:
+                consonants = 0
+                for unit in following:
+                    if unit[2]:
+                        break
+                    consonants += len(unit[0])
+                if index != stressed and graphemes == "e":
+                    ipa = "ə"
+                elif index == stressed and consonants <= 1:
+                    ipa = _VOWELS[graphemes][0]
+                else:
+                    ipa = _VOWELS[graphemes][1]
+        elif graphemes == "ch":
+            ipa = "x" if previous and previous[0] in ("a", "o", "u", "au") else "ç"
+        elif graphemes == "s":
+            at_start = index == 0
+            before_vowel = bool(following) and following[0][2]
+            if at_start and following and following[0][0] in ("p", "t"):
+                ipa = "ʃ"
+            elif before_vowel and (at_start or previous[2] or previous[0] in ("l", "m", "n", "r")):
+                ipa = "z"
+            else:
+                ipa = "s"
+        elif graphemes == "g" and previous and previous[0] == "i" and not following:
+            ipa = "ç"
+        elif graphemes == "r" and previous and previous[2] and not (following and following[0][2]):
+            # vocalized r after a vowel at the end of a syllable
+            if phones[-1] == "ə":
+                # "er" in unstressed syllables (the empty string keeps phones aligned with units)
+                phones[-1] = ""
+                ipa = "ɐ"
+            elif index - 1 == stressed:
+                ipa = "ɐ̯"
+        # final devoicing at the end of the word or before another consonant
+        if not is_vowel and ipa in _DEVOICED and (not following or not following[0][2]):
+            if not (following and following[0][1] in ("l", "ʁ", "n") and ipa in ("b", "d", "ɡ")):
+                ipa = _DEVOICED[ipa]
+        phones.append(ipa)
+
+    if len(vowel_units) > 1:
+        phones.insert(_onset(units, phones, stressed), "ˈ")
+    return "".join(phones)
+
+
+# position in phones where the stressed syllable (starting at the vowel unit "stressed") begins
+def _onset(units, phones, stressed):
+    start = stressed
+    while start > 0 and not units[start - 1][2]:
+        start -= 1
+    if start == 0:
+        return 0
+    consonants = stressed - start
+    if consonants >= 2 and (phones[stressed - 2], phones[stressed - 1]) in _ONSET_CLUSTERS:
+        return stressed - 2
+    return stressed - 1 if consonants else stressed
+
+
+########################################################################################
+# lexicon based guesses
+########################################################################################
+
+# the spelling of a word as it is found in the lexicon (trying different capitalizations)
+def _known(part):
+    lexicon = get_lexicon()
+    for variant in dict.fromkeys((part, part.capitalize(), part.lower())):
+        if variant in lexicon:
+            return variant
+    return None
+
+
+# The split_compound function splits a word into words of the lexicon (fewest parts, longest first part)
+# input: word (string)
+# output: list of (part, linking element) tuples or None if the word can't be split
+def split_compound(word):
+    lower = word.lower()
+
+    @lru_cache(maxsize=None)
+    def split(start):
+        best = None
+        for end in range(len(lower), start + MIN_PART_LENGTH - 1, -1):
+            part = _known(word[start:end])
+            if part is None:
+                continue
+            if end == len(lower):
+                return ((part, ""),)
+            for linker, linker_ipa in _LINKERS:
+                if not lower.startswith(linker, end):
+                    continue
+                rest = split(end + len(linker))
+                if rest is not None and (best is None or len(rest) + 1 < len(best)):
+                    best = ((part, linker),) + rest
+        return best
+
+    parts = split(0)
+    return list(parts) if parts is not None and len(parts) > 1 else None
+
+
+# ipa and lemma of a compound built from the entries of its parts
+def _compound_entry(word, parts):
+    lexicon = get_lexicon()
+    linker_ipa = dict(_LINKERS)
+    ipa = ""
+    for index, (part, linker) in enumerate(parts):
+        part_ipa = lexicon.entries(part)[0].ipa
+        if index == 0:
+            if "ˈ" not in part_ipa:
+                part_ipa = "ˈ" + part_ipa.replace("ˌ", "")
+        else:
+            part_ipa = part_ipa.replace("ˈ", "ˌ")
+            if "ˌ" not in part_ipa:
+                part_ipa = "ˌ" + part_ipa
+        ipa += part_ipa + linker_ipa[linker]
+    # the lemma of a compound is the lemma of its last part with the other parts in front
+    head = parts[-1][0]
+    head_lemma = lexicon.entries(head)[0].lemma
+    prefix = word[:len(word) - len(head)]
+    lemma = prefix + (head_lemma[0].lower() + head_lemma[1:] if prefix else head_lemma)
+    return Entry(lemma, ipa, get_rhyme(ipa), get_word_meter(ipa))
+
+
+@lru_cache(maxsize=OOV_CACHE_SIZE)
+def _guess(word):
+    known = _known(word)
+    if known is not None:
+        return tuple(get_lexicon().entries(known))
+    parts = split_compound(word)
+    if parts is not None:
+        return (_compound_entry(word, parts),)
+    ipa = rule_ipa(word)
+    if not ipa:
+        return None
+    return (Entry(word, ipa, get_rhyme(ipa), get_word_meter(ipa)),)
+
+
+# The guess_entries function returns the entries of a word, guessing them if the word is not in the lexicon
+# input: word (string)
+# output: list of entries (list) or None if nothing can be guessed (i.e. for punctuation)
+def guess_entries(word):
+    if not isinstance(word, str) or not word:
+        return None
+    entries = get_lexicon().entries(word)
+    if entries is not None:
+        return entries
+    guessed = _guess(word)
+    return None if guessed is None else list(guessed)
+
+
+# The guess_ipa function returns the ipa code of any word, guessing it if the word is not in the lexicon
+# input: word (string)
+# output: ipa code (string)
+def guess_ipa(word):
+    entries = guess_entries(word)
+    return entries[0].ipa if entries else ""
+
+
+# statistics of the cache of guessed words (hits, misses, maxsize, currsize)
+def oov_cache_info():
+    return _guess.cache_info()
+
+
+def clear_oov_cache():
+    _guess.cache_clear()
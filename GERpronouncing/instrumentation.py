@@ -0,0 +1,159 @@
+# Opt-in instrumentation of the public functions
+#
+# enable_stats() replaces the public functions of the package (ipa, rhyme, rhymes, meter, meters_like, ...) by
+# wrappers which count the calls and errors and record the duration of every call in a histogram with
+# logarithmic buckets. disable_stats() restores the original functions, so there is no overhead at all as long
+# as the instrumentation is not enabled. Only calls through the package namespace (gp.ipa(...)) are recorded,
+# references taken before enable_stats() was called (from GERpronouncing import ipa) keep the original functions.
+# Calls between the public functions (i.e. rhymes calling rhyme) are recorded for both functions.
+# get_stats() can be read at any time, i.e. from a monitoring endpoint of a running service.
+
+import threading
+import time
+from functools import wraps
+
+from . import lexicon as _lexicon_module
+
+# names of the functions which are wrapped by enable_stats
+INSTRUMENTED = ("ipa", "rhyme", "rhymes", "count_syllables", "same_syllables", "meter", "meters", "meters_like",
+                "find_words", "lemmas", "possible_forms_of", "forms_of", "forms_of_many", "analyze_many",
+                "near_rhymes", "guess_ipa", "guess_entries")
+
+# upper bound of the first histogram bucket in seconds, every further bucket is twice as wide
+FIRST_BUCKET = 1e-6
+BUCKETS = 32
+
+
+class TimingHistogram:
+    __slots__ = ("counts", "count", "errors", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = 0
+        bound = FIRST_BUCKET
+        while seconds > bound and bucket < BUCKETS - 1:
+            bucket += 1
+            bound *= 2
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # upper bound of the bucket containing the q-th quantile (0 < q <= 1) in seconds
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(FIRST_BUCKET * 2 ** bucket, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {"count": self.count, "errors": self.errors, "total_seconds": self.total,
+                "mean_seconds": self.total / self.count if self.count else None,
+                "p50_seconds": self.percentile(0.5), "p90_seconds": self.percentile(0.9),
+                "p99_seconds": self.percentile(0.99), "max_seconds": self.max,
+                # (upper bound in seconds, number of calls) of every non-empty bucket
+                "histogram": [(FIRST_BUCKET * 2 ** bucket, count)
+                              for bucket, count in enumerate(self.counts) if count]}
+
+
+_histograms = {}
+_stats_lock = threading.Lock()
+# original function of every wrapped name
+_originals = {}
+
+
+def _instrument(name, function):
+    histogram = _histograms.setdefault(name, TimingHistogram())
+    clock = time.perf_counter
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        failed = True
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = clock() - start
+            with _stats_lock:
+                histogram.add(seconds)
+                histogram.errors += failed
+
+    return wrapper
+
+
+# The enable_stats function starts recording the calls of the public functions
+def enable_stats():
+    import GERpronouncing as package
+    with _stats_lock:
+        if _originals:
+            return
+        wrappers = {}
+        for name in INSTRUMENTED:
+            function = getattr(package, name)
+            # aliases (forms_of) share the wrapper and the histogram of the function
+            if function not in wrappers:
+                wrappers[function] = _instrument(function.__name__, function)
+            _originals[name] = function
+            setattr(package, name, wrappers[function])
+
+
+# The disable_stats function restores the original functions (the recorded statistics are kept)
+def disable_stats():
+    import GERpronouncing as package
+    with _stats_lock:
+        for name, function in _originals.items():
+            setattr(package, name, function)
+        _originals.clear()
+
+
+def stats_enabled():
+    return bool(_originals)
+
+
+# The reset_stats function clears the recorded calls
+def reset_stats():
+    with _stats_lock:
+        for histogram in _histograms.values():
+            histogram.__init__()
+
+
+# statistics of the caches and indexes (without loading anything which is not loaded yet)
+def cache_stats():
+    from .g2p import oov_cache_info
+    from . import rhyme_index, meter_index
+    lexicon = _lexicon_module._lexicon
+    result = {"oov": oov_cache_info()._asdict(),
+              "entries": None,
+              "rhyme_index_keys": rhyme_index._index.size if rhyme_index._index is not None else None,
+              "meter_trie_keys": meter_index._trie.size if meter_index._trie is not None else None}
+    if lexicon is not None:
+        info = lexicon.cache_info()
+        result["entries"] = info._asdict() if info is not None else None
+    return result
+
+
+# The get_stats function returns the recorded calls, the cache statistics and the lexicon load time
+# output: dictionary with the keys "enabled", "calls" (per function), "caches" and "lexicon"
+def get_stats():
+    with _stats_lock:
+        calls = {name: histogram.as_dict() for name, histogram in _histograms.items() if histogram.count}
+    lexicon = _lexicon_module._lexicon
+    info = {"loaded": False, "backend": None, "load_seconds": None, "memory": None}
+    if lexicon is not None:
+        info = {"loaded": True, "backend": type(lexicon).__name__, "load_seconds": _lexicon_module.load_seconds,
+                "memory": lexicon.memory_usage()}
+    return {"enabled": stats_enabled(), "calls": calls, "caches": cache_stats(), "lexicon": info}
@@ -0,0 +1,599 @@
+# Loading and storage of the pronounciation lexicon
+#
+# The Wiktionary CSV inside data/de_ipa_wiktionary.zip is compiled once into a binary snapshot
+# (data/de_ipa_wiktionary.lex) containing a string table and offset arrays for every index.
+# The snapshot is memory-mapped and only resolved on first lookup, so importing GERpronouncing
+# is cheap and forked worker processes share the same pages instead of holding their own copies.
+#
+# Snapshot layout (all integers in native byte order, arrays are uint32):
+#   header:   magic, format version, byte order flag, size/checksum of the source CSV, section count
+#   sections: name, offset, length (one record per section, payloads are 8 byte aligned)
+#   strblob/stroffs:                  utf-8 string table and its offsets
+#   e_word/e_lemma/e_ipa/e_rhyme/e_meter: one string id per CSV row (in CSV order)
+#   w_*/r_*/m_*/s_*/l_*:              word/rhyme/meter/syllable/lemma indexes, each consisting of
+#                                     sorted keys, start offsets and a posting list of row ids
+
+import os
+import sys
+import mmap
+import struct
+import time
+import zipfile
+import threading
+from collections.abc import Mapping
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from .phonetics import get_rhyme
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SOURCE_PATH = os.path.join(DATA_DIR, "de_ipa_wiktionary.zip")
+SNAPSHOT_NAME = "de_ipa_wiktionary.lex"
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "GERpronouncing")
+
+SNAPSHOT_MAGIC = b"GERP"
+SNAPSHOT_VERSION = 2
+
+_HEADER = struct.Struct("<4sIIQQI")
+_SECTION = struct.Struct("<8sQQ")
+# section prefix of every index in the snapshot
+_INDEXES = {"word": "w", "rhyme": "r", "meter": "m", "syllables": "s", "lemma": "l"}
+
+
+# read the rows (word, lemma, ipa, meter) of the Wiktionary CSV
+# input: path of the zip archive (string)
+# output: rows (list of lists)
+def read_rows(path=SOURCE_PATH):
+    with zipfile.ZipFile(path, "r") as archive:
+        with archive.open("de_ipa_wiktionary.csv") as csvfile:
+            wiki_read = csvfile.read().decode("utf-8")
+    rows = (row.split(",") for row in wiki_read.split("\n")[1:-1])
+    return [row for row in rows if len(row) == 4]
+
+
+# size and checksum of the CSV inside the source zip, used to detect outdated snapshots
+# (only the zip directory is read, the CSV itself is not decompressed)
+def source_stamp(path=SOURCE_PATH):
+    try:
+        with zipfile.ZipFile(path, "r") as archive:
+            info = archive.getinfo("de_ipa_wiktionary.csv")
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+    return (info.file_size, info.CRC)
+
+
+# possible locations of the snapshot, the package data directory is preferred
+def snapshot_paths():
+    return [os.path.join(DATA_DIR, SNAPSHOT_NAME), os.path.join(CACHE_DIR, SNAPSHOT_NAME)]
+
+
+########################################################################################
+# snapshot writer
+########################################################################################
+
+# compile a lexicon into a binary snapshot
+# input: lexicon (CompactLexicon or rows (word, lemma, ipa, meter)), path (string), stamp of the source (tuple)
+# output: path of the written snapshot (string)
+def write_snapshot(lexicon, path, stamp=None):
+    if not isinstance(lexicon, CompactLexicon):
+        lexicon = CompactLexicon(lexicon)
+
+    # the ipa codes follow the other strings in the string table of the snapshot
+    encoded = [string.encode("utf-8") for string in lexicon.strings + lexicon.ipas]
+    offsets = array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    columns = list(lexicon.columns)
+    columns[2] = array("I", [ipa_id + len(lexicon.strings) for ipa_id in columns[2]])
+    sections = [("strblob", b"".join(encoded)), ("stroffs", offsets)]
+    sections += zip(("e_word", "e_lemma", "e_ipa", "e_rhyme", "e_meter"), columns)
+    for kind, name in _INDEXES.items():
+        # string keys are sorted by their utf-8 bytes (same order as the code points),
+        # syllable keys are plain integers
+        if name == "s":
+            keys = sorted(lexicon.keys(kind))
+        else:
+            keys = sorted(map(lexicon.string_ids.__getitem__, lexicon.keys(kind)), key=encoded.__getitem__)
+        starts = array("I", [0])
+        post = array("I")
+        for key in keys:
+            post.extend(lexicon.postings(kind, key if name == "s" else lexicon.strings[key]))
+            starts.append(len(post))
+        sections += [(name + "_keys", array("I", keys)), (name + "_start", starts), (name + "_post", post)]
+
+    size, checksum = stamp or (0, 0)
+    table_end = _HEADER.size + _SECTION.size * len(sections)
+    records = []
+    payloads = []
+    position = table_end
+    for name, data in sections:
+        data = bytes(data)
+        padding = -position % 8
+        position += padding
+        records.append(_SECTION.pack(name.encode("ascii"), position, len(data)))
+        payloads.append(b"\0" * padding + data)
+        position += len(data)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # write to a temporary file first, so concurrent readers never see a half written snapshot
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, sys.byteorder == "little",
+                                 size, checksum, len(sections)))
+            f.writelines(records)
+            f.writelines(payloads)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+# compile the bundled Wiktionary CSV into a snapshot
+# input: path of the snapshot (string, optional), path of the zip archive (string, optional)
+# output: path of the written snapshot (string)
+def build_snapshot(path=None, source=SOURCE_PATH):
+    lexicon = CompactLexicon(read_rows(source))
+    stamp = source_stamp(source)
+    if path is not None:
+        return write_snapshot(lexicon, path, stamp)
+    error = None
+    for candidate in snapshot_paths():
+        try:
+            return write_snapshot(lexicon, candidate, stamp)
+        except OSError as e:
+            error = e
+    raise error
+
+
+########################################################################################
+# lexicon backends
+# Every backend offers the same small interface used by the public functions:
+#   entries(word), entry(entry_id), word(entry_id), postings(kind, key), words(), rows(), keys(kind),
+#   words_by(kind, key), entry_count(), memory_usage(), cache_info()
+# with kind being one of "rhyme", "meter", "syllables" or "lemma" (words_by("lemma", lemma) are the forms)
+# and postings also accepting "word"
+########################################################################################
+
+_KINDS = ("rhyme", "meter", "syllables", "lemma")
+_SAMPLE_STEP = 32
+ENTRY_CACHE_SIZE = 16384
+
+
+# one pronounciation entry of a word (created on demand, the lexicon only stores integer ids)
+class Entry:
+    __slots__ = ("lemma", "ipa", "rhyme", "meter")
+
+    def __init__(self, lemma, ipa, rhyme, meter):
+        self.lemma = lemma
+        self.ipa = ipa
+        self.rhyme = rhyme
+        self.meter = meter
+
+    @property
+    def syllables(self):
+        return len(self.meter)
+
+    def __eq__(self, other):
+        return isinstance(other, Entry) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self):
+        return hash(self.as_tuple())
+
+    def __repr__(self):
+        return "Entry(lemma=%r, ipa=%r, rhyme=%r, meter=%r)" % self.as_tuple()
+
+    def as_tuple(self):
+        return (self.lemma, self.ipa, self.rhyme, self.meter)
+
+    # the format of the former words_dict values
+    def as_dict(self):
+        return {"lemma": self.lemma, "ipa": self.ipa, "rhyme": self.rhyme,
+                "syllables": len(self.meter), "meter": self.meter}
+
+
+NO_ENTRY = 0xFFFFFFFF
+
+
+# postings with a single row are stored as a plain integer instead of an array
+def _ids(postings):
+    return (postings,) if isinstance(postings, int) else postings
+
+
+def _add_posting(index, key, entry_id):
+    postings = index.get(key)
+    if postings is None:
+        index[key] = entry_id
+    elif isinstance(postings, int):
+        index[key] = array("I", (postings, entry_id))
+    else:
+        postings.append(entry_id)
+
+
+# lexicon resolved lazily from a memory-mapped snapshot
+class MappedLexicon:
+    def __init__(self, path, stamp=None):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little, size, checksum, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("incompatible lexicon snapshot: %s" % path)
+        if bool(little) != (sys.byteorder == "little"):
+            raise ValueError("lexicon snapshot was built with a different byte order: %s" % path)
+        if stamp is not None and (size, checksum) != stamp:
+            raise ValueError("lexicon snapshot is outdated: %s" % path)
+        self.path = path
+
+        view = memoryview(self._mm)
+        sections = {}
+        for i in range(count):
+            name, offset, length = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+
+        def uint32(name):
+            offset, length = sections[name]
+            return view[offset:offset + length].cast("I")
+
+        self._blob = sections["strblob"][0]
+        self._offsets = uint32("stroffs")
+        self._word = uint32("e_word")
+        self._lemma = uint32("e_lemma")
+        self._ipa = uint32("e_ipa")
+        self._rhyme = uint32("e_rhyme")
+        self._meter = uint32("e_meter")
+        self._index = {name: (uint32(name + "_keys"), uint32(name + "_start"), uint32(name + "_post"))
+                       for name in _INDEXES.values()}
+        # every _SAMPLE_STEP-th key of the string indexes, created on the first lookup of an index
+        self._samples = {}
+        # word frequencies in texts are very skewed, so the decoded entries of frequent words are cached
+        # (the returned lists are shared and must not be modified)
+        self._cached_entries = lru_cache(maxsize=ENTRY_CACHE_SIZE)(self._entries)
+
+    def __len__(self):
+        return len(self._index["w"][0])
+
+    # number of rows (entry ids are 0 ... entry_count() - 1)
+    def entry_count(self):
+        return len(self._word)
+
+    def __contains__(self, word):
+        return self._find("w", word) >= 0
+
+    def _bytes(self, string_id):
+        blob, offsets = self._blob, self._offsets
+        return self._mm[blob + offsets[string_id]:blob + offsets[string_id + 1]]
+
+    def _string(self, string_id):
+        return self._bytes(string_id).decode("utf-8")
+
+    # position of a key in the sorted keys of an index (-1 if it is missing)
+    def _find(self, name, key):
+        keys = self._index[name][0]
+        if name == "s":
+            if not isinstance(key, int):
+                return -1
+            position = bisect_left(keys, key)
+            return position if position < len(keys) and keys[position] == key else -1
+        if not isinstance(key, str):
+            return -1
+        try:
+            target = key.encode("utf-8")
+        except UnicodeEncodeError:
+            # lone surrogates (i.e. from errors="surrogateescape") are never part of the snapshot
+            return -1
+        # narrow the search to one block with the sampled keys, then search the mapped keys
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = [self._bytes(keys[i]) for i in range(0, len(keys), _SAMPLE_STEP)]
+        low = max(bisect_left(samples, target) - 1, 0) * _SAMPLE_STEP
+        high = min(low + 2 * _SAMPLE_STEP, len(keys))
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(keys[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(keys) and self._bytes(keys[low]) == target:
+            return low
+        return -1
+
+    def _postings(self, name, key):
+        position = self._find(name, key)
+        if position < 0:
+            return None
+        keys, starts, post = self._index[name]
+        return post[starts[position]:starts[position + 1]]
+
+    # row ids of a word, a lemma or a key of the rhyme/meter/syllable index (None if it is missing)
+    def postings(self, kind, key):
+        return self._postings(_INDEXES[kind], key)
+
+    def word(self, entry_id):
+        return self._string(self._word[entry_id])
+
+    def entry(self, entry_id):
+        string = self._string
+        return Entry(string(self._lemma[entry_id]), string(self._ipa[entry_id]),
+                     string(self._rhyme[entry_id]), string(self._meter[entry_id]))
+
+    def entries(self, word):
+        return self._cached_entries(word) if isinstance(word, str) else None
+
+    def _entries(self, word):
+        postings = self._postings("w", word)
+        if postings is None:
+            return None
+        return [self.entry(i) for i in postings]
+
+    def words(self):
+        return (self._string(string_id) for string_id in self._index["w"][0])
+
+    def rows(self):
+        string = self._string
+        for i in range(len(self._word)):
+            yield (string(self._word[i]), string(self._lemma[i]), string(self._ipa[i]), string(self._meter[i]))
+
+    def keys(self, kind):
+        keys = self._index[_INDEXES[kind]][0]
+        if kind == "syllables":
+            return iter(keys.tolist())
+        return (self._string(string_id) for string_id in keys)
+
+    def words_by(self, kind, key):
+        postings = self._postings(_INDEXES[kind], key)
+        if postings is None:
+            return None
+        return [self._string(self._word[i]) for i in postings]
+
+    # statistics of the cache of decoded entries (hits, misses, maxsize, currsize)
+    def cache_info(self):
+        return self._cached_entries.cache_info()
+
+    # the mapped pages are shared between processes, so only the snapshot size is reported
+    def memory_usage(self):
+        entries = len(self._word)
+        return {"entries": entries, "words": len(self), "strings": len(self._offsets) - 1,
+                "bytes": len(self._mm), "bytes_per_entry": len(self._mm) / max(entries, 1), "shared": True}
+
+
+# index from string ids to rows without per-key objects: head holds the last added row of every
+# string id and next chains back to the previous rows with the same key
+class _ChainIndex:
+    __slots__ = ("head", "next", "count")
+
+    def __init__(self):
+        self.head = array("I")
+        self.next = array("I")
+        self.count = 0
+
+    def add(self, string_id, entry_id):
+        while len(self.head) <= string_id:
+            self.head.append(NO_ENTRY)
+        while len(self.next) <= entry_id:
+            self.next.append(NO_ENTRY)
+        if self.head[string_id] == NO_ENTRY:
+            self.count += 1
+        self.next[entry_id] = self.head[string_id]
+        self.head[string_id] = entry_id
+
+    # row ids in insertion order
+    def postings(self, string_id):
+        if string_id is None or string_id >= len(self.head) or self.head[string_id] == NO_ENTRY:
+            return None
+        ids = []
+        entry_id = self.head[string_id]
+        while entry_id != NO_ENTRY:
+            ids.append(entry_id)
+            entry_id = self.next[entry_id]
+        ids.reverse()
+        return ids
+
+    def keys(self):
+        return (string_id for string_id, entry_id in enumerate(self.head) if entry_id != NO_ENTRY)
+
+    def nbytes(self):
+        return sys.getsizeof(self.head) + sys.getsizeof(self.next)
+
+
+# in-memory lexicon with interned strings and array-backed columns
+# Every distinct string is stored once, rows are five uint32 string ids (word, lemma, ipa, rhyme, meter).
+# The ipa codes (almost one per row) are interned in a table of their own, so the head arrays of the
+# _ChainIndex of words, lemmas and rhymes only span the other strings. Words, lemmas and rhymes are found
+# through the interning table and their _ChainIndex, so no per-key objects are needed. The meter and syllable
+# indexes map their few keys to posting lists of row ids.
+# This is used to compile the snapshot and as fallback when no snapshot can be written
+# (i.e. read-only installations).
+# Memory target: at most 64 bytes per row for the columns and indexes only, the string tables and the strings
+# come on top of that. memory_usage() reports both, "index_bytes_per_entry" and the total "bytes_per_entry".
+class CompactLexicon:
+    def __init__(self, rows=()):
+        self.strings = []
+        self.string_ids = {}
+        self.ipas = []
+        self.ipa_ids = {}
+        self.columns = tuple(array("I") for _ in range(5))
+        self.chains = {"word": _ChainIndex(), "lemma": _ChainIndex(), "rhyme": _ChainIndex()}
+        self.indexes = {"meter": {}, "syllables": {}}
+        for word, lemma, ipa, meter in rows:
+            self.add(word, lemma, ipa, meter)
+
+    def intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    # add a row and return its row id
+    def add(self, word, lemma, ipa, meter, rhyme=None):
+        if rhyme is None:
+            rhyme = get_rhyme(ipa)
+        entry_id = len(self.columns[0])
+        ipa_id = self.ipa_ids.get(ipa)
+        if ipa_id is None:
+            ipa_id = self.ipa_ids[ipa] = len(self.ipas)
+            self.ipas.append(ipa)
+        ids = [self.intern(word), self.intern(lemma), ipa_id, self.intern(rhyme), self.intern(meter)]
+        for column, string_id in zip(self.columns, ids):
+            column.append(string_id)
+        self.chains["word"].add(ids[0], entry_id)
+        self.chains["lemma"].add(ids[1], entry_id)
+        self.chains["rhyme"].add(ids[3], entry_id)
+        # keys are the interned string objects, so the indexes do not hold copies
+        _add_posting(self.indexes["meter"], self.strings[ids[4]], entry_id)
+        _add_posting(self.indexes["syllables"], len(meter), entry_id)
+        return entry_id
+
+    def __len__(self):
+        return self.chains["word"].count
+
+    def entry_count(self):
+        return len(self.columns[0])
+
+    def __contains__(self, word):
+        return self.postings("word", word) is not None
+
+    # row ids of a word, a lemma or a key of the rhyme/meter/syllable index (None if it is missing)
+    def postings(self, kind, key):
+        if kind in self.chains:
+            string_id = self.string_ids.get(key) if isinstance(key, str) else None
+            return self.chains[kind].postings(string_id)
+        try:
+            postings = self.indexes[kind].get(key)
+        except TypeError:
+            return None
+        return None if postings is None else _ids(postings)
+
+    def word(self, entry_id):
+        return self.strings[self.columns[0][entry_id]]
+
+    def entry(self, entry_id):
+        strings = self.strings
+        word, lemma, ipa, rhyme, meter = self.columns
+        return Entry(strings[lemma[entry_id]], self.ipas[ipa[entry_id]], strings[rhyme[entry_id]],
+                     strings[meter[entry_id]])
+
+    def entries(self, word):
+        postings = self.postings("word", word)
+        if postings is None:
+            return None
+        return [self.entry(i) for i in postings]
+
+    def words(self):
+        return self.keys("word")
+
+    def rows(self):
+        strings, ipas = self.strings, self.ipas
+        for word, lemma, ipa, rhyme, meter in zip(*self.columns):
+            yield (strings[word], strings[lemma], ipas[ipa], strings[meter])
+
+    def keys(self, kind):
+        if kind in self.chains:
+            return map(self.strings.__getitem__, self.chains[kind].keys())
+        return iter(self.indexes[kind])
+
+    def words_by(self, kind, key):
+        postings = self.postings(kind, key)
+        if postings is None:
+            return None
+        strings, words = self.strings, self.columns[0]
+        return [strings[words[i]] for i in postings]
+
+    def memory_usage(self):
+        string_bytes = sum(sys.getsizeof(table) for table in (self.strings, self.string_ids, self.ipas, self.ipa_ids))
+        string_bytes += sum(sys.getsizeof(string) for string in self.strings + self.ipas)
+        index_bytes = sum(sys.getsizeof(column) for column in self.columns)
+        index_bytes += sum(chain.nbytes() for chain in self.chains.values())
+        for index in self.indexes.values():
+            index_bytes += sys.getsizeof(index)
+            index_bytes += sum(sys.getsizeof(postings) for postings in index.values()
+                               if not isinstance(postings, int) or postings > 256)
+        entries = len(self.columns[0])
+        return {"entries": entries, "words": len(self), "strings": len(self.strings) + len(self.ipas),
+                "string_bytes": string_bytes, "index_bytes": index_bytes, "bytes": string_bytes + index_bytes,
+                "bytes_per_entry": (string_bytes + index_bytes) / max(entries, 1),
+                "index_bytes_per_entry": index_bytes / max(entries, 1), "shared": False}
+
+    # the entries are not cached, since they are resolved from the columns in memory
+    def cache_info(self):
+        return None
+
+
+########################################################################################
+# loading
+########################################################################################
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+# duration of loading the lexicon in seconds (including a rebuild of the snapshot), None before the first lookup
+load_seconds = None
+
+
+# load the lexicon from the snapshot, (re)building the snapshot if it is missing or outdated
+# output: lexicon (MappedLexicon/CompactLexicon)
+def load_lexicon():
+    stamp = source_stamp()
+    for path in snapshot_paths():
+        try:
+            return MappedLexicon(path, stamp)
+        except (OSError, ValueError, KeyError, struct.error):
+            pass
+    lexicon = CompactLexicon(read_rows())
+    for path in snapshot_paths():
+        try:
+            return MappedLexicon(write_snapshot(lexicon, path, stamp), stamp)
+        except (OSError, ValueError):
+            pass
+    return lexicon
+
+
+# return the lexicon shared by all functions, loading it on first use
+def get_lexicon():
+    global _lexicon, load_seconds
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                start = time.perf_counter()
+                _lexicon = load_lexicon()
+                load_seconds = time.perf_counter() - start
+    return _lexicon
+
+
+# replace the lexicon shared by all functions (i.e. by an overlay with additional entries, see overlay.py)
+def set_lexicon(lexicon):
+    global _lexicon
+    with _lexicon_lock:
+        _lexicon = lexicon
+
+
+# read-only dictionary view on the lexicon, resolved on first access
+# (words_dict, rhymes_dict, meters_dict and syllables_dict are instances of this class)
+class LexiconView(Mapping):
+    def __init__(self, kind):
+        self.kind = kind
+
+    def __getitem__(self, key):
+        if self.kind == "word":
+            value = get_lexicon().entries(key)
+            if value is not None:
+                value = [entry.as_dict() for entry in value]
+        else:
+            value = get_lexicon().words_by(self.kind, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        if self.kind == "word":
+            return get_lexicon().words()
+        return get_lexicon().keys(self.kind)
+
+    def __len__(self):
+        if self.kind == "word":
+            return len(get_lexicon())
+        return sum(1 for _ in self)
@@ -0,0 +1,188 @@
+# Pattern queries over meters: a trie over the meter keys of the lexicon
+#
+# Meter patterns may contain wildcards ("?" for one syllable with any stress, "*" for any number of syllables)
+# and can be restricted to a prefix or suffix, a number of syllables and a rhyme. Secondary stress can be treated
+# like primary stress (levels=False). Patterns are matched by walking a trie of all meter keys (and a trie of
+# the reversed keys for suffixes), the words are only collected for the matching keys and paginated lazily.
+
+import re
+import heapq
+import threading
+from itertools import islice
+
+from .lexicon import get_lexicon
+
+
+# stress level of a syllable, with levels=False secondary stress (2) counts as primary stress (1)
+def _level(stress, levels):
+    return stress if levels or stress != "2" else "1"
+
+
+class MeterTrie:
+    def __init__(self, meters):
+        # a node is {stress: child node} with the key "" holding the meter keys ending at the node
+        self._root = {}
+        self._reversed = {}
+        self.size = 0
+        for meter in meters:
+            self.add(meter)
+
+    def add(self, meter):
+        for root, key in ((self._root, meter), (self._reversed, meter[::-1])):
+            node = root
+            for stress in key:
+                node = node.setdefault(stress, {})
+            meters = node.setdefault("", [])
+            if meter in meters:
+                return
+            meters.append(meter)
+        self.size += 1
+
+    # all meter keys below a node
+    def _below(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for stress in sorted(node, reverse=True):
+                if stress == "":
+                    yield from node[""]
+                else:
+                    stack.append(node[stress])
+
+    # meter keys matching a pattern with wildcards
+    def match(self, pattern, levels=True):
+        results = []
+        seen = set()
+        stack = [(self._root, 0)]
+        while stack:
+            node, position = stack.pop()
+            if (id(node), position) in seen:
+                continue
+            seen.add((id(node), position))
+            if position == len(pattern):
+                results += node.get("", [])
+                continue
+            symbol = pattern[position]
+            if symbol == "*":
+                # the star matches nothing (next pattern symbol) or one more syllable (same pattern symbol)
+                stack.append((node, position + 1))
+                stack += [(child, position) for stress, child in node.items() if stress]
+            else:
+                for stress, child in node.items():
+                    if stress and (symbol == "?" or _level(stress, levels) == _level(symbol, levels)):
+                        stack.append((child, position + 1))
+        return sorted(results)
+
+    # meter keys starting (or ending, reverse=True) with a pattern
+    def starting_with(self, pattern, levels=True, reverse=False):
+        nodes = [self._reversed if reverse else self._root]
+        for symbol in (pattern[::-1] if reverse else pattern):
+            nodes = [child for node in nodes for stress, child in node.items()
+                     if stress and (symbol == "?" or _level(stress, levels) == _level(symbol, levels))]
+        return sorted(meter for node in nodes for meter in self._below(node))
+
+
+_trie = None
+_trie_lexicon = None
+_trie_lock = threading.Lock()
+
+
+# The meter_trie function returns the trie over all meter keys of the lexicon (built on first use)
+def meter_trie():
+    global _trie, _trie_lexicon
+    lexicon = get_lexicon()
+    with _trie_lock:
+        if _trie is None or _trie_lexicon is not lexicon:
+            _trie = MeterTrie(lexicon.keys("meter"))
+            _trie_lexicon = lexicon
+        return _trie
+
+
+# The update_meter_trie function adds the meter keys of new entries to the trie after the lexicon "previous"
+# was changed to "lexicon" (see overlay.py)
+def update_meter_trie(previous, lexicon, meters):
+    global _trie_lexicon
+    with _trie_lock:
+        # an index built by a query during the change (from the new lexicon with only part of its rows) may
+        # lack some of the keys as well, add ignores the keys which are already present
+        if _trie is not None and (_trie_lexicon is previous or _trie_lexicon is lexicon):
+            for meter in meters:
+                _trie.add(meter)
+            _trie_lexicon = lexicon
+
+
+# The matching_meters function returns the meter keys of the lexicon which fulfill all given constraints
+# input: pattern (string with "0", "1", "2", "?" and "*" or a regular expression if regex=True), prefix (string),
+#        suffix (string), syllables (integer), levels (boolean), regex (boolean)
+# output: meter keys (list)
+def matching_meters(pattern=None, prefix=None, suffix=None, syllables=None, levels=True, regex=False):
+    trie = meter_trie()
+    if pattern is None and syllables is not None:
+        pattern, regex = "?" * syllables, False
+    # the prefix and suffix are walked in the trie and the reversed trie, their results are intersected
+    candidates = None
+    for constraint, reverse in ((prefix, False), (suffix, True)):
+        if constraint:
+            found = trie.starting_with(constraint, levels, reverse)
+            if candidates is not None:
+                allowed = set(candidates)
+                found = [meter for meter in found if meter in allowed]
+            candidates = found
+    if pattern is not None and not regex:
+        meters = trie.match(pattern, levels)
+        if candidates is not None:
+            allowed = set(candidates)
+            meters = [meter for meter in meters if meter in allowed]
+    else:
+        meters = candidates if candidates is not None else trie.match("*", levels)
+        if pattern is not None:
+            expression = re.compile(pattern)
+            meters = [meter for meter in meters
+                      if expression.fullmatch(meter if levels else meter.replace("2", "1"))]
+    if syllables is not None:
+        meters = [meter for meter in meters if len(meter) == syllables]
+    return meters
+
+
+# row ids of the entries with one of the meters, in lexicon order
+def _entry_ids(lexicon, meters):
+    return heapq.merge(*[lexicon.postings("meter", meter) or () for meter in meters])
+
+
+# The pattern_words function returns the word of every entry whose meter matches a pattern (see meters_like).
+# Like meters_dict[meter], a word is returned once per matching entry and the words are in lexicon order,
+# with or without wildcards.
+# input: pattern (string), levels (boolean), limit (integer or None), offset (integer)
+# output: list of words (list)
+def pattern_words(pattern, levels=True, limit=None, offset=0):
+    lexicon = get_lexicon()
+    if levels and "?" not in pattern and "*" not in pattern:
+        # a plain pattern is a key of the meter index
+        meters = [pattern]
+    else:
+        meters = matching_meters(pattern, levels=levels)
+    words = (lexicon.word(entry_id) for entry_id in _entry_ids(lexicon, meters))
+    return list(islice(words, offset, None if limit is None else offset + limit))
+
+
+# The find_words function returns words whose meter fulfills all given constraints, optionally only words with a
+# given rhyme. Every word is returned once, in lexicon order, and the results can be paginated with offset and
+# limit.
+# input: pattern (string), prefix (string), suffix (string), syllables (integer), rhyme (string), levels (boolean),
+#        regex (boolean), limit (integer or None), offset (integer)
+# output: list of words (list)
+def find_words(pattern=None, prefix=None, suffix=None, syllables=None, rhyme=None, levels=True, regex=False,
+               limit=None, offset=0):
+    meters = matching_meters(pattern, prefix, suffix, syllables, levels, regex)
+    lexicon = get_lexicon()
+    if rhyme is None:
+        words = (lexicon.word(entry_id) for entry_id in _entry_ids(lexicon, meters))
+    else:
+        # filter the (usually shorter) posting list of the rhyme by the matching meters
+        meters = set(meters)
+        postings = lexicon.postings("rhyme", rhyme) or []
+        words = (lexicon.word(entry_id) for entry_id in postings if lexicon.entry(entry_id).meter in meters)
+    # a word with several pronounciations is only returned for its first matching entry
+    seen = set()
+    words = (word for word in words if not (word in seen or seen.add(word)))
+    return list(islice(words, offset, None if limit is None else offset + limit))
@@ -0,0 +1,284 @@
+# Overlays: adding, correcting and removing entries without rebuilding the lexicon
+#
+# The first change wraps the lexicon into an OverlayLexicon. The base lexicon (usually the memory-mapped snapshot)
+# stays untouched, the added rows are stored in a small CompactLexicon behind it (their entry ids continue after the
+# rows of the base) and removed rows are kept in a set of entry ids. Only the words and index keys touched by a
+# change are merged, all other lookups go straight to the base lexicon. get_rhyme/get_meter are only run for the
+# added rows and the rhyme index and meter trie are extended instead of being rebuilt.
+#
+# save_overlay writes all changes to a json file including the derived rhymes and meters, so load_overlay can apply
+# them at startup without deriving anything. load_overlay also reads CSV files in the format of the Wiktionary CSV
+# (a header line, then word,lemma,ipa,meter with an optional meter).
+
+import json
+import threading
+
+from .phonetics import get_rhyme, get_word_meter
+from .lexicon import get_lexicon, set_lexicon, CompactLexicon, _KINDS
+
+OVERLAY_VERSION = 1
+
+_overlay_lock = threading.Lock()
+
+
+# lexicon with added and removed rows on top of a base lexicon (same interface as the other backends)
+class OverlayLexicon:
+    def __init__(self, base):
+        self.base = base
+        self.added = CompactLexicon()
+        # entry ids of the added rows start after the rows of the base
+        self.offset = base.entry_count()
+        self.removed = set()
+        # words and index keys with added or removed rows, all other keys are resolved by the base only
+        self.touched = {kind: set() for kind in ("word",) + _KINDS}
+
+    def _touched(self, kind, key):
+        try:
+            return key in self.touched[kind]
+        except TypeError:
+            return False
+
+    def _touch(self, word, lemma, rhyme, meter):
+        for kind, key in (("word", word), ("lemma", lemma), ("rhyme", rhyme), ("meter", meter),
+                          ("syllables", len(meter))):
+            self.touched[kind].add(key)
+
+    # add a row and return its entry id
+    def add(self, word, lemma, ipa, meter, rhyme):
+        self._touch(word, lemma, rhyme, meter)
+        return self.offset + self.added.add(word, lemma, ipa, meter, rhyme)
+
+    def remove(self, entry_id):
+        entry = self.entry(entry_id)
+        self._touch(self.word(entry_id), entry.lemma, entry.rhyme, entry.meter)
+        self.removed.add(entry_id)
+
+    def __len__(self):
+        count = len(self.base)
+        # a copy, _apply may touch more words meanwhile
+        for word in tuple(self.touched["word"]):
+            count += (self.postings("word", word) is not None) - (word in self.base)
+        return count
+
+    def __contains__(self, word):
+        if self._touched("word", word):
+            return self.postings("word", word) is not None
+        return word in self.base
+
+    def postings(self, kind, key):
+        postings = self.base.postings(kind, key)
+        if not self._touched(kind, key):
+            return postings
+        removed, offset = self.removed, self.offset
+        merged = [entry_id for entry_id in postings or () if entry_id not in removed]
+        merged += [offset + entry_id for entry_id in self.added.postings(kind, key) or ()
+                   if offset + entry_id not in removed]
+        return merged or None
+
+    def word(self, entry_id):
+        if entry_id < self.offset:
+            return self.base.word(entry_id)
+        return self.added.word(entry_id - self.offset)
+
+    def entry(self, entry_id):
+        if entry_id < self.offset:
+            return self.base.entry(entry_id)
+        return self.added.entry(entry_id - self.offset)
+
+    def entries(self, word):
+        if not self._touched("word", word):
+            return self.base.entries(word)
+        postings = self.postings("word", word)
+        return None if postings is None else [self.entry(entry_id) for entry_id in postings]
+
+    def words(self):
+        for word in self.base.words():
+            if word not in self.touched["word"] or self.postings("word", word) is not None:
+                yield word
+        for word in list(self.added.words()):
+            if word not in self.base and self.postings("word", word) is not None:
+                yield word
+
+    def rows(self):
+        for entry_id, row in enumerate(self.base.rows()):
+            if entry_id not in self.removed:
+                yield row
+        for entry_id, row in enumerate(self.added.rows(), self.offset):
+            if entry_id not in self.removed:
+                yield row
+
+    def keys(self, kind):
+        touched = self.touched[kind]
+        for key in self.base.keys(kind):
+            if key not in touched or self.postings(kind, key) is not None:
+                yield key
+        for key in list(self.added.keys(kind)):
+            if self.base.postings(kind, key) is None and self.postings(kind, key) is not None:
+                yield key
+
+    def words_by(self, kind, key):
+        if not self._touched(kind, key):
+            return self.base.words_by(kind, key)
+        postings = self.postings(kind, key)
+        return None if postings is None else [self.word(entry_id) for entry_id in postings]
+
+    def entry_count(self):
+        return self.offset + self.added.entry_count()
+
+    def memory_usage(self):
+        usage = dict(self.base.memory_usage())
+        usage["overlay"] = {"added": self.added.entry_count(), "removed": len(self.removed),
+                            "bytes": self.added.memory_usage()["bytes"]}
+        return usage
+
+    def cache_info(self):
+        return self.base.cache_info()
+
+
+# the overlay of the shared lexicon (created on the first change)
+def _overlay():
+    lexicon = get_lexicon()
+    if not isinstance(lexicon, OverlayLexicon):
+        lexicon = OverlayLexicon(lexicon)
+        set_lexicon(lexicon)
+    return lexicon
+
+
+# update everything derived from the lexicon after a change:
+# new rhyme and meter keys are added to the indexes, cached guesses and wiki_rows are dropped
+def _changed(previous, lexicon, rhymes, meters):
+    from .rhyme_index import update_rhyme_index
+    from .meter_index import update_meter_trie
+    from .g2p import clear_oov_cache
+    from . import drop_wiki_rows
+    update_rhyme_index(previous, lexicon, rhymes)
+    update_meter_trie(previous, lexicon, meters)
+    clear_oov_cache()
+    drop_wiki_rows()
+
+
+# entry ids of the rows of a word, optionally only with a given lemma and/or ipa code
+def _matching(lexicon, word, lemma=None, ipa=None):
+    matching = []
+    for entry_id in lexicon.postings("word", word) or ():
+        entry = lexicon.entry(entry_id)
+        if (lemma is None or entry.lemma == lemma) and (ipa is None or entry.ipa == ipa):
+            matching.append(entry_id)
+    return matching
+
+
+# apply added rows (word, lemma, ipa, meter, rhyme) and removed rows (word, lemma, ipa) in one change
+# output: (number of added rows, number of removed rows)
+def _apply(added=(), removed=()):
+    with _overlay_lock:
+        previous = get_lexicon()
+        lexicon = _overlay()
+        removed_count = 0
+        for word, lemma, ipa in removed:
+            for entry_id in _matching(lexicon, word, lemma, ipa):
+                lexicon.remove(entry_id)
+                removed_count += 1
+        rhymes, meters = [], []
+        added_count = 0
+        for word, lemma, ipa, meter, rhyme in added:
+            if lexicon.postings("rhyme", rhyme) is None:
+                rhymes.append(rhyme)
+            if lexicon.postings("meter", meter) is None:
+                meters.append(meter)
+            lexicon.add(word, lemma, ipa, meter, rhyme)
+            added_count += 1
+        _changed(previous, lexicon, rhymes, meters)
+    return added_count, removed_count
+
+
+# The add_entry function adds a pronounciation of a word to the lexicon (i.e. for brand names or dialect forms).
+# The rhyme is derived from the ipa code, as well as the meter if it is not given. With replace=True the existing
+# entries of the word with the same lemma are removed first (to correct an ipa code).
+# input: word (string), ipa (string), lemma (string, the word itself by default), meter (string), replace (boolean)
+# output: the added entry (Entry)
+def add_entry(word, ipa, lemma=None, meter=None, replace=False):
+    if not isinstance(word, str) or not word or not isinstance(ipa, str) or not ipa:
+        raise ValueError("add_entry needs a word and its ipa code")
+    lemma = word if lemma is None else lemma
+    meter = get_word_meter(ipa) if meter is None else meter
+    _apply([(word, lemma, ipa, meter, get_rhyme(ipa))], [(word, lemma, None)] if replace else ())
+    return get_lexicon().entries(word)[-1]
+
+
+# The remove_entry function removes the entries of a word, optionally only the ones with a given lemma and/or ipa
+# input: word (string), lemma (string), ipa (string)
+# output: number of removed entries (integer)
+def remove_entry(word, lemma=None, ipa=None):
+    return _apply(removed=[(word, lemma, ipa)])[1]
+
+
+# rows of an overlay file: json written by save_overlay or a CSV like the Wiktionary CSV
+def _read_overlay(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            added = []
+            for line in f.read().split("\n")[1:]:
+                row = line.rstrip("\r").split(",")
+                if len(row) not in (3, 4) or not row[0] or not row[2]:
+                    continue
+                word, lemma, ipa = row[:3]
+                meter = row[3] if len(row) == 4 and row[3] else get_word_meter(ipa)
+                added.append((word, lemma or word, ipa, meter, get_rhyme(ipa)))
+            return added, []
+        data = json.load(f)
+    if data.get("version") != OVERLAY_VERSION:
+        raise ValueError("unsupported overlay version: %s" % path)
+    return [tuple(row) for row in data["added"]], [tuple(row) for row in data["removed"]]
+
+
+# The load_overlay function applies the changes of an overlay file
+# (a json file written by save_overlay or a CSV file with the columns word,lemma,ipa,meter)
+# input: path (string)
+# output: (number of added entries, number of removed entries) (tuple)
+def load_overlay(path):
+    added, removed = _read_overlay(path)
+    return _apply(added, removed)
+
+
+# rows of all changes of a lexicon: added rows (word, lemma, ipa, meter, rhyme) and removed rows (word, lemma, ipa)
+def overlay_rows(lexicon):
+    added, removed = [], []
+    if isinstance(lexicon, OverlayLexicon):
+        for entry_id in range(lexicon.offset, lexicon.entry_count()):
+            if entry_id not in lexicon.removed:
+                entry = lexicon.entry(entry_id)
+                added.append((lexicon.word(entry_id), entry.lemma, entry.ipa, entry.meter, entry.rhyme))
+        for entry_id in sorted(lexicon.removed):
+            if entry_id < lexicon.offset:
+                entry = lexicon.entry(entry_id)
+                removed.append((lexicon.word(entry_id), entry.lemma, entry.ipa))
+    return added, removed
+
+
+# The save_overlay function writes all changes since the lexicon was loaded to a json file
+# Added entries are stored with their rhyme and meter, removed entries by word, lemma and ipa code
+# (so the file still applies to a rebuilt snapshot).
+# input: path (string)
+# output: (number of added entries, number of removed entries) (tuple)
+def save_overlay(path):
+    added, removed = overlay_rows(get_lexicon())
+
+    # one row per line, so overlay files can be reviewed and diffed
+    def rows(rows):
+        return "[" + ",".join("\n  " + json.dumps(row, ensure_ascii=False) for row in rows) + "]"
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"version": %d,\n "added": %s,\n "removed": %s}\n' % (OVERLAY_VERSION, rows(added), rows(removed)))
+    return len(added), len(removed)
+
+
+# The clear_overlay function discards all changes and returns to the bundled lexicon
+def clear_overlay():
+    with _overlay_lock:
+        lexicon = get_lexicon()
+        if isinstance(lexicon, OverlayLexicon):
+            set_lexicon(lexicon.base)
+            from .g2p import clear_oov_cache
+            from . import drop_wiki_rows
+            clear_oov_cache()
+            drop_wiki_rows()
@@ -0,0 +1,116 @@
+# Parallel processing of large corpora with a pool of worker processes
+#
+# The lexicon is loaded once in the parent process before the pool is started. Forked workers share its pages
+# (the memory-mapped snapshot is shared by all processes in any case, so spawned workers only map the file
+# instead of rebuilding the lexicon). Spawned workers start from the snapshot, so the changes of an overlay
+# (add_entry, load_overlay, ...) are passed to them and applied once per worker when the pool is started.
+# The input is cut into chunks of lines, at most a few chunks per worker are
+# in flight at the same time (so the input is still read lazily) and the results are yielded in input order.
+# process_corpus gets the words, meters and rhymes of a chunk packed into three strings from the workers (the
+# parent knows the lines already), the dictionaries of the lines are only built when they are yielded. Pickling
+# one dictionary per line would make the parent spend about as long unpickling them as a single process spends
+# scanning the lines.
+
+import multiprocessing
+import sys
+from collections import deque
+from itertools import islice
+
+from .lexicon import get_lexicon
+from .overlay import overlay_rows, _apply
+from .scansion import CHUNK_SIZE, read_lines, scan_chunk, line_result, assign_rhyme_scheme
+
+# number of chunks per worker which are submitted before waiting for results
+CHUNKS_PER_WORKER = 2
+
+
+def _context():
+    # fork shares the already loaded lexicon with the workers, it is only used on Linux (it is not available on
+    # Windows and not safe with the system frameworks on macOS, where Python starts processes with spawn)
+    if sys.platform.startswith("linux"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+# initializer of spawned workers: apply the changes of the overlay of the parent process
+def _init_worker(added, removed):
+    _apply(added, removed)
+
+
+# The map_chunks function applies a function to chunks of items in a pool of processes
+# The function must be picklable (defined at module level), it is called with a list of items and the
+# additional arguments args. The results are yielded in input order.
+# input: function, items (iterable), workers (integer), chunk_size (integer), args (tuple)
+# output: generator of the results of every chunk
+def map_chunks(function, items, workers, chunk_size=CHUNK_SIZE, args=()):
+    args = tuple(args)
+    items = iter(items)
+    chunks = iter(lambda: list(islice(items, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield function(chunk, *args)
+        return
+
+    lexicon = get_lexicon()
+    context = _context()
+    changes = overlay_rows(lexicon) if context.get_start_method() != "fork" else ((), ())
+    if any(changes):
+        pool = context.Pool(workers, _init_worker, changes)
+    else:
+        pool = context.Pool(workers)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(function, (chunk,) + args))
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    except BaseException:
+        # errors in a worker and generators closed early stop the pool without waiting for the workers
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+
+
+# scan a chunk of lines in a worker: the words, meters (separated by spaces) and rhymes of every line (separated
+# by line breaks), neither contain spaces or line breaks
+def _scan_packed(lines, fallback):
+    results = scan_chunk(lines, fallback)
+    return ("\n".join([" ".join(result["words"]) for result in results]),
+            "\n".join([" ".join(result["meters"]) for result in results]),
+            "\n".join([result["rhyme"] for result in results]))
+
+
+# line analyses of a chunk of lines from the packed results of _scan_packed
+def _unpack(lines, packed):
+    words, meters, rhymes = (column.split("\n") for column in packed)
+    for text, line_words, line_meters, rhyme in zip(lines, words, meters, rhymes):
+        if line_words:
+            yield line_result(text, line_words.split(" "), line_meters.split(" "), rhyme)
+        else:
+            yield line_result(text, [], [], rhyme)
+
+
+# The process_corpus function scans a text like scan_corpus, distributing the chunks of lines over
+# several worker processes. The results are the same and in the same order as with scan_corpus.
+# input: source (file path or iterable of lines), workers (integer), chunk_size (integer), fallback (boolean),
+#        encoding (string)
+# output: generator of line analyses (dictionaries)
+def process_corpus(source, workers=1, chunk_size=CHUNK_SIZE, fallback=True, encoding="utf-8"):
+    if workers <= 1:
+        chunks = map_chunks(scan_chunk, read_lines(source, encoding), workers, chunk_size, (fallback,))
+        return assign_rhyme_scheme(result for chunk in chunks for result in chunk)
+    lines = read_lines(source, encoding)
+    # the chunks in flight, map_chunks cuts the lines into the same chunks and yields their results in order
+    pending = deque()
+
+    def chunked():
+        for chunk in iter(lambda: list(islice(lines, chunk_size)), []):
+            pending.append(chunk)
+            yield from chunk
+
+    packed = map_chunks(_scan_packed, chunked(), workers, chunk_size, (fallback,))
+    return assign_rhyme_scheme(result for columns in packed for result in _unpack(pending.popleft(), columns))
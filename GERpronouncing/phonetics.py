@@ -0,0 +1,138 @@
+# Phonetic helpers working on plain ipa strings (no lexicon access)
+
+ipa_vowels = ['o','u','i','a','ə','ɐ','ɪ','ʏ','ʊ','e','ɛ','ø','ɔ','œ','y','ɑ','æ','ɯ','ɒ','ε','ɘ','I','U','ɜ','ɝ','ı','ɵ','ʌ','ɨ','õ','ā']
+
+
+# function to identify the rhyme of a given ipa-word
+def get_rhyme(ipa_word):
+    rhyme = ipa_word
+    # for words with more syllables identify the main stress part of the word
+    # and cut off the rest
+    if "ˈ" in rhyme:
+        while rhyme[0] != "ˈ":
+            rhyme = rhyme[1:]
+        rhyme = rhyme[1:]
+    # cut off all consonants until the next vowel
+    for i in rhyme:
+        if i not in ipa_vowels:
+            rhyme = rhyme[1:]
+        else:
+            break
+    return rhyme
+
+# function to identify the meter of a given ipa-word
+def get_meter(ipa_word):
+    vowels = []
+    string = ""
+    for index,letter in enumerate(ipa_word):
+        if letter in ["ˌ","ˈ",'̯']:
+            string += letter
+        if letter in ipa_vowels+['̩','̍'] and index != len(ipa_word)-1:
+            string += letter
+            if ipa_word[index+1] != '̯':
+                vowels.append(string)
+                string = ""
+        if letter in ipa_vowels+['̩','̍'] and index == len(ipa_word)-1:
+            string += letter
+            vowels.append(string)
+    meter = ""
+    for vowel in vowels:
+        if "ˈ" in vowel:
+            meter += "1"
+        elif "ˌ" in vowel:
+            meter += "2"
+        else:
+            meter += "0"
+    return meter
+
+# meter of a word from its ipa code, monosyllabic words are stressed like in the lexicon
+# (their ipa code has no stress mark)
+def get_word_meter(ipa_word):
+    meter = get_meter(ipa_word)
+    if meter and "1" not in meter:
+        meter = "1" + meter[1:]
+    return meter
+
+########################################################################################
+# phonemes
+# ipa strings are split into phonemes (a base symbol with its diacritics) to compare pronounciations
+########################################################################################
+
+_MODIFIERS = ['ː','ˑ','̯','̩','̍','̃','ʰ','ʲ','ʷ','̥','̊','̝','̞']
+_IGNORED = ['ˈ','ˌ','.','-',' ','​']
+_R_SOUNDS = ['r','ʀ','ɾ','ʁ']
+
+# tense/lax and long/short vowels of the same quality form a group
+_VOWEL_GROUPS = {'i':'i','ɪ':'i','ı':'i','I':'i','e':'e','ɛ':'e','ε':'e','æ':'e','a':'a','ɑ':'a','ā':'a','ɒ':'o',
+                 'o':'o','ɔ':'o','õ':'o','u':'u','ʊ':'u','U':'u','y':'y','ʏ':'y','ø':'ø','œ':'ø','ə':'ə','ɘ':'ə',
+                 'ɜ':'ə','ɝ':'ə','ɵ':'ø','ʌ':'a','ɨ':'i','ɯ':'u'}
+_VOICING = {'b':'p','d':'t','ɡ':'k','v':'f','z':'s','ʒ':'ʃ','d͡ʒ':'t͡ʃ','ʝ':'ç','ɣ':'x'}
+_VOICING.update({voiceless: voiced for voiced, voiceless in list(_VOICING.items())})
+
+
+# The phonemes function splits an ipa string into phonemes, stress marks are dropped.
+# To compare rhymes the spelling variants of r are unified: "ɐ" becomes "ə" + "ʁ", non-syllabic "ɐ̯" and
+# all r sounds become "ʁ" and syllabic consonants ("n̩") become "ə" + consonant.
+# input: ipa code (string)
+# output: phonemes (list)
+def phonemes(ipa_word):
+    units = []
+    for letter in ipa_word:
+        if letter in _IGNORED:
+            continue
+        if units and (letter in _MODIFIERS or units[-1].endswith('͡')):
+            units[-1] += letter
+        elif letter == '͡' and units:
+            units[-1] += letter
+        else:
+            units.append(letter)
+    result = []
+    for unit in units:
+        base, marks = unit[0], unit[1:]
+        if base == 'ɐ':
+            result += ['ʁ'] if '̯' in marks else ['ə','ʁ']
+        elif base in _R_SOUNDS:
+            result.append('ʁ')
+        elif base not in ipa_vowels and ('̩' in marks or '̍' in marks):
+            result += ['ə', base]
+        else:
+            result.append(unit)
+    return result
+
+
+def is_vowel(phoneme):
+    return phoneme[0] in ipa_vowels
+
+
+# cost of replacing one phoneme by another (ins/del cost 2):
+# 0 identical, 1 vowels of the same group (length/tenseness) or voiced/voiceless pairs, 2 other phonemes of the
+# same class, 4 vowel and consonant (these costs form a metric, so the distance can be used in a BK-tree)
+def phoneme_cost(a, b):
+    if a == b:
+        return 0
+    vowel_a, vowel_b = is_vowel(a), is_vowel(b)
+    if vowel_a and vowel_b:
+        return 1 if _VOWEL_GROUPS.get(a[0], a[0]) == _VOWEL_GROUPS.get(b[0], b[0]) else 2
+    if not vowel_a and not vowel_b:
+        a, b = a.rstrip(''.join(_MODIFIERS)), b.rstrip(''.join(_MODIFIERS))
+        return 1 if a == b or _VOICING.get(a) == b else 2
+    return 4
+
+
+# weighted edit distance of two phoneme sequences (in units of phoneme_cost, one insertion/deletion costs 2)
+def phoneme_distance(a, b, cost=phoneme_cost):
+    previous = list(range(0, 2 * len(b) + 1, 2))
+    for x in a:
+        current = [previous[0] + 2]
+        for j, y in enumerate(b):
+            current.append(min(previous[j + 1] + 2, current[j] + 2, previous[j] + cost(x, y)))
+        previous = current
+    return previous[-1]
+
+
+# The rhyme_distance function compares two rhymes (or any ipa codes), 0.5 is i.e. a different vowel length,
+# 1 a different consonant or one additional phoneme
+# input: ipa code (string), ipa code (string)
+# output: distance (float)
+def rhyme_distance(ipa_a, ipa_b):
+    return phoneme_distance(phonemes(ipa_a), phonemes(ipa_b)) / 2
@@ -0,0 +1,156 @@
+# Near rhymes: a BK-tree over the rhyme keys of the lexicon
+#
+# rhymes() only finds words with exactly the same rhyme. To find near rhymes (different vowel length,
+# final devoicing, "ɐ" vs "ər", assonance, consonance, ...) the distinct rhyme keys are split into phonemes
+# and stored in a BK-tree with the phoneme-feature-aware edit distance of phonetics.py. A query only
+# compares the rhymes in the branches which can contain results, instead of all keys.
+
+import threading
+
+from .phonetics import phonemes, phoneme_cost
+from .lexicon import get_lexicon
+
+
+class RhymeIndex:
+    def __init__(self, rhymes):
+        # phonemes are replaced by integer ids with a precomputed cost table
+        self._phoneme_ids = {}
+        self._phonemes = []
+        self._costs = []
+        # a node is [phoneme ids, rhyme keys, {distance: child node}]
+        self._root = None
+        self.size = 0
+        # the phoneme tables and the tree are extended by add and by encoding queries with new phonemes,
+        # concurrent searches (i.e. from a thread pool) only read them
+        self._lock = threading.Lock()
+        for rhyme in rhymes:
+            self.add(rhyme)
+
+    def _encode(self, rhyme):
+        ids = []
+        for phoneme in phonemes(rhyme):
+            phoneme_id = self._phoneme_ids.get(phoneme)
+            if phoneme_id is None:
+                phoneme_id = self._phoneme_ids[phoneme] = len(self._phonemes)
+                self._phonemes.append(phoneme)
+                for other, row in zip(self._phonemes, self._costs):
+                    row.append(phoneme_cost(other, phoneme))
+                self._costs.append([phoneme_cost(phoneme, other) for other in self._phonemes])
+            ids.append(phoneme_id)
+        return tuple(ids)
+
+    # weighted edit distance (one insertion/deletion costs 2, see phonetics.phoneme_cost)
+    def _distance(self, a, b):
+        costs = self._costs
+        previous = list(range(0, 2 * len(b) + 1, 2))
+        for x in a:
+            row = costs[x]
+            current = [previous[0] + 2]
+            for j, y in enumerate(b):
+                current.append(min(previous[j + 1] + 2, current[j] + 2, previous[j] + row[y]))
+            previous = current
+        return previous[-1]
+
+    def add(self, rhyme):
+        with self._lock:
+            self._add(rhyme)
+
+    def _add(self, rhyme):
+        key = self._encode(rhyme)
+        if self._root is None:
+            self._root = [key, [rhyme], {}]
+            self.size += 1
+            return
+        node = self._root
+        while True:
+            distance = self._distance(key, node[0])
+            if distance == 0 and key == node[0]:
+                # rhymes which only differ in stress marks or r spelling share a node
+                if rhyme not in node[1]:
+                    node[1].append(rhyme)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [rhyme], {}]
+                self.size += 1
+                return
+            node = child
+
+    # rhyme keys within max_cost of a rhyme (costs in units of phoneme_cost)
+    # output: list of (cost, rhyme key) sorted by cost
+    def search(self, rhyme, max_cost):
+        if self._root is None:
+            return []
+        # the cost rows of new phonemes are appended before any node uses them, so encoding the query under
+        # the lock is enough to keep the rows aligned with the phoneme ids
+        with self._lock:
+            key = self._encode(rhyme)
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = self._distance(key, node[0])
+            if distance <= max_cost:
+                results += [(distance, found) for found in list(node[1])]
+            for child_distance, child in list(node[2].items()):
+                if distance - max_cost <= child_distance <= distance + max_cost:
+                    stack.append(child)
+        results.sort()
+        return results
+
+
+_index = None
+_index_lexicon = None
+_index_lock = threading.Lock()
+
+
+# The rhyme_index function returns the index over all rhyme keys of the lexicon (built on first use)
+def rhyme_index():
+    global _index, _index_lexicon
+    lexicon = get_lexicon()
+    with _index_lock:
+        if _index is None or _index_lexicon is not lexicon:
+            _index = RhymeIndex(lexicon.keys("rhyme"))
+            _index_lexicon = lexicon
+        return _index
+
+
+# The update_rhyme_index function adds the rhyme keys of new entries to the index after the lexicon "previous"
+# was changed to "lexicon" (see overlay.py), instead of rebuilding the whole index on the next query.
+# Keys without entries stay in the index, their words are looked up when they are found.
+def update_rhyme_index(previous, lexicon, rhymes):
+    global _index_lexicon
+    with _index_lock:
+        # an index built by a query during the change (from the new lexicon with only part of its rows) may
+        # lack some of the keys as well, add ignores the keys which are already present
+        if _index is not None and (_index_lexicon is previous or _index_lexicon is lexicon):
+            for rhyme in rhymes:
+                _index.add(rhyme)
+            _index_lexicon = lexicon
+
+
+# The near_rhymes function returns words whose rhyme is similar, but not identical to the rhyme of a word.
+# The distance is 0.5 for i.e. a different vowel length or final devoicing and 1 for a different phoneme or
+# one phoneme more or less. Spelling variants of r ("ɐ", "ər", "ʁ") count as equal.
+# Results are ranked by distance (nearest first), exact rhymes are returned by the rhymes function.
+# input: word (string), max_distance (float), limit (integer or None), lemma (string), variation (integer),
+#        fallback (boolean)
+# output: list of (word, distance) tuples
+def near_rhymes(word, max_distance=1, limit=20, lemma="", variation=0, fallback=False):
+    from . import rhyme
+    word_rhyme = rhyme(word, lemma, variation, fallback)
+    if not word_rhyme or isinstance(word_rhyme, list):
+        return []
+    lexicon = get_lexicon()
+    results = []
+    seen = {word}
+    for cost, found in rhyme_index().search(word_rhyme, int(max_distance * 2)):
+        if found == word_rhyme:
+            continue
+        for other in lexicon.words_by("rhyme", found) or []:
+            if other not in seen:
+                seen.add(other)
+                results.append((other, cost / 2))
+                if limit is not None and len(results) >= limit:
+                    return results
+    return results
@@ -0,0 +1,116 @@
+# Streaming scansion of large texts (poems, lyrics, ...)
+#
+# The lines are read lazily and analyzed in chunks with analyze_many, so only chunk_size lines are held in memory.
+# For every line the meter patterns of its words are concatenated to the stress pattern of the line and the rhyme
+# of the last word is used to assign a rhyme scheme letter (a, b, c, ...). Blank lines separate stanzas, the
+# rhyme scheme starts again with "a" in every stanza.
+
+import os
+import re
+from itertools import islice
+from collections import OrderedDict
+from string import ascii_lowercase
+
+CHUNK_SIZE = 1000
+MAX_SCHEME_RHYMES = 256
+
+_WORD = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+
+
+# The tokenize function splits a line into words (letters and hyphenated words, no punctuation or numbers)
+# input: line (string)
+# output: words (list)
+def tokenize(line):
+    return _WORD.findall(line)
+
+
+# lines of a file path or of any iterable of strings, without line breaks
+def read_lines(source, encoding="utf-8"):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding=encoding) as f:
+            for line in f:
+                yield line.rstrip("\r\n")
+    else:
+        for line in source:
+            yield line.rstrip("\r\n")
+
+
+# analysis of a line from its words, their meters and the rhyme of the last word
+def line_result(text, words, meters, rhyme):
+    # words without a known meter are marked with "?"
+    return {"text": text, "words": words, "meters": meters, "meter": "".join([meter or "?" for meter in meters]),
+            "rhyme": rhyme}
+
+
+# analyze one chunk of lines (without the rhyme scheme, which depends on the previous lines)
+def scan_chunk(lines, fallback=True):
+    from . import analyze_many
+    words = [tokenize(line) for line in lines]
+    columns = analyze_many([word for line_words in words for word in line_words],
+                           fields=("meter", "rhyme"), fallback=fallback)
+    meters, rhymes = columns["meter"], columns["rhyme"]
+    results = []
+    position = 0
+    for line, line_words in zip(lines, words):
+        line_meters = meters[position:position + len(line_words)]
+        position += len(line_words)
+        results.append(line_result(line, line_words, line_meters, rhymes[position - 1] if line_words else ""))
+    return results
+
+
+# The scan_lines function analyzes lines chunk by chunk (without rhyme scheme letters)
+# input: lines (iterable of strings), chunk_size (integer), fallback (boolean)
+# output: generator of line analyses (dictionaries)
+def scan_lines(lines, chunk_size=CHUNK_SIZE, fallback=True):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        for result in scan_chunk(chunk, fallback):
+            yield result
+
+
+# scheme letter of the n-th distinct rhyme of a stanza: a ... z, a2 ... z2, a3 ...
+def _scheme_letter(number):
+    letter = ascii_lowercase[number % 26]
+    return letter if number < 26 else letter + str(number // 26 + 1)
+
+
+# The assign_rhyme_scheme function adds the key "scheme" to line analyses
+# Lines with the same rhyme in a stanza get the same letter, lines without words get "" and lines with an
+# unknown rhyme get "-". Only the last max_rhymes rhymes of a stanza are remembered, so memory stays bounded
+# for texts without stanzas.
+# input: line analyses (iterable of dictionaries), max_rhymes (integer)
+# output: generator of line analyses (dictionaries)
+def assign_rhyme_scheme(results, max_rhymes=MAX_SCHEME_RHYMES):
+    letters = OrderedDict()
+    count = 0
+    for result in results:
+        if not result["words"]:
+            if not result["text"].strip():
+                letters.clear()
+                count = 0
+            result["scheme"] = ""
+        elif not result["rhyme"]:
+            result["scheme"] = "-"
+        else:
+            rhyme = result["rhyme"]
+            if rhyme in letters:
+                letters.move_to_end(rhyme)
+            else:
+                letters[rhyme] = _scheme_letter(count)
+                count += 1
+                if len(letters) > max_rhymes:
+                    letters.popitem(last=False)
+            result["scheme"] = letters[rhyme]
+        yield result
+
+
+# The scan_corpus function scans a text line by line and yields the results incrementally
+# Every result contains the keys "text", "words", "meters" (per word), "meter" (the stress pattern of the line),
+# "rhyme" (of the last word) and "scheme" (the rhyme scheme letter).
+# input: source (file path or iterable of lines), chunk_size (integer), fallback (boolean), encoding (string)
+# output: generator of line analyses (dictionaries)
+def scan_corpus(source, chunk_size=CHUNK_SIZE, fallback=True, encoding="utf-8"):
+    return assign_rhyme_scheme(scan_lines(read_lines(source, encoding), chunk_size, fallback))
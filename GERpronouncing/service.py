@@ -0,0 +1,337 @@
+# Asyncio service layer for applications with many concurrent requests
+#
+# LookupService loads the lexicon once in a worker thread (so the event loop is never blocked by loading or
+# rebuilding the snapshot). Lookups of single words (ipa, rhyme, meter, syllables) are put into a queue and
+# coalesced into micro-batches: a single batcher task collects all requests which arrive within max_delay seconds
+# (at most max_batch) and resolves them with one analyze_many call in the thread pool. Queries with possibly large
+# results (rhymes, same_syllables, meters_like, near_rhymes, ...) are run in the thread pool as well.
+# The service records the latency of every method, the queue depth and the batch sizes (see metrics()).
+#
+# serve() exposes the service as a small local HTTP server (TCP or Unix socket) returning JSON, i.e.
+#   GET /ipa?word=Haus   GET /rhymes?word=Haus   GET /meters_like?pattern=*10&limit=20   GET /metrics
+# usage: python -m GERpronouncing.service [--host HOST] [--port PORT] [--unix PATH]
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urlsplit, parse_qs
+
+from .lexicon import get_lexicon
+from .instrumentation import TimingHistogram
+
+# fields resolved by a micro-batch (all of them are looked up at once, a request picks its field)
+SERVICE_FIELDS = ("ipa", "rhyme", "meter", "syllables")
+MAX_BATCH = 512
+MAX_DELAY = 0.0005
+WORKERS = 4
+
+
+class LookupService:
+    def __init__(self, max_batch=MAX_BATCH, max_delay=MAX_DELAY, workers=WORKERS, fallback=False):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.workers = workers
+        self.fallback = fallback
+        self._executor = None
+        self._queue = None
+        self._batcher = None
+        self._starting = None
+        self._latency = {}
+        self._batches = 0
+        self._batched = 0
+        self._max_batch_seen = 0
+        self._max_queue_depth = 0
+        self._heavy_in_flight = 0
+
+    # The start method loads the lexicon in the thread pool and starts the batcher (concurrent calls share one start)
+    async def start(self):
+        if self._starting is None:
+            self._starting = asyncio.get_running_loop().create_task(self._start())
+        await self._starting
+        return self
+
+    async def _start(self):
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._queue = asyncio.Queue()
+        await loop.run_in_executor(self._executor, get_lexicon)
+        self._batcher = loop.create_task(self._run_batches())
+
+    async def close(self):
+        if self._batcher is None:
+            return
+        self._starting = None
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        self._batcher = None
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _record(self, name, start):
+        self._latency.setdefault(name, TimingHistogram()).add(time.perf_counter() - start)
+
+    ####################################################################################
+    # micro-batched lookups of single words
+    ####################################################################################
+
+    async def _run_batches(self):
+        from . import analyze_many
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = []
+            try:
+                batch.append(await queue.get())
+                # wait a moment for concurrent requests unless the batch is already full
+                if self.max_delay > 0 and queue.qsize() < self.max_batch - 1:
+                    await asyncio.sleep(self.max_delay)
+                while len(batch) < self.max_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                batch = [request for request in batch if not request[2].done()]
+                if not batch:
+                    continue
+                self._batches += 1
+                self._batched += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                try:
+                    columns = await loop.run_in_executor(
+                        self._executor, partial(analyze_many, [request[0] for request in batch], SERVICE_FIELDS,
+                                                fallback=self.fallback))
+                except Exception as error:
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(error)
+                    continue
+            except asyncio.CancelledError:
+                # close(): the requests taken from the queue are cancelled like the ones still in it
+                for _, _, future in batch:
+                    if not future.done():
+                        future.cancel()
+                raise
+            for index, (_, field, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(columns[field][index] if field else
+                                      {name: columns[name][index] for name in SERVICE_FIELDS})
+
+    # The lookup method returns a field ("ipa", "rhyme", "meter" or "syllables") of a word, or all of them as a
+    # dictionary if field is None. Unknown words get an empty string (like ipa(word)).
+    async def lookup(self, word, field="ipa"):
+        if field is not None and field not in SERVICE_FIELDS:
+            raise ValueError("unknown field %r, choose from %s" % (field, ", ".join(SERVICE_FIELDS)))
+        if self._batcher is None:
+            await self.start()
+        start = time.perf_counter()
+        if not isinstance(word, str):
+            return "" if field else {name: "" for name in SERVICE_FIELDS}
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((word, field, future))
+        self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+        try:
+            return await future
+        finally:
+            self._record(field or "analyze", start)
+
+    async def ipa(self, word):
+        return await self.lookup(word, "ipa")
+
+    async def rhyme(self, word):
+        return await self.lookup(word, "rhyme")
+
+    async def meter(self, word):
+        return await self.lookup(word, "meter")
+
+    async def count_syllables(self, word):
+        return await self.lookup(word, "syllables")
+
+    async def analyze(self, word):
+        return await self.lookup(word, None)
+
+    ####################################################################################
+    # queries in the thread pool
+    ####################################################################################
+
+    # The run method calls any function of the package in the thread pool
+    async def run(self, function, *args, **kwargs):
+        if self._batcher is None:
+            await self.start()
+        start = time.perf_counter()
+        self._heavy_in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                                    partial(function, *args, **kwargs))
+        finally:
+            self._heavy_in_flight -= 1
+            self._record(function.__name__, start)
+
+    async def rhymes(self, word, lemma="", variation=0):
+        from . import rhymes
+        return await self.run(rhymes, word, lemma, variation)
+
+    async def same_syllables(self, word, lemma="", variation=0):
+        from . import same_syllables
+        return await self.run(same_syllables, word, lemma, variation)
+
+    async def meters(self, word, lemma="", variation=0):
+        from . import meters
+        return await self.run(meters, word, lemma, variation)
+
+    async def meters_like(self, meter_pattern, levels=True, limit=None, offset=0):
+        from . import meters_like
+        return await self.run(meters_like, meter_pattern, levels, limit, offset)
+
+    async def find_words(self, **constraints):
+        from . import find_words
+        return await self.run(find_words, **constraints)
+
+    async def near_rhymes(self, word, max_distance=1, limit=20):
+        from . import near_rhymes
+        return await self.run(near_rhymes, word, max_distance, limit)
+
+    async def forms_of(self, lemma):
+        from . import possible_forms_of
+        return await self.run(possible_forms_of, lemma)
+
+    # The metrics method returns the latency of every method, the queue depth and the batch sizes
+    def metrics(self):
+        return {"queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches, "batched_requests": self._batched,
+                "mean_batch_size": self._batched / self._batches if self._batches else None,
+                "max_batch_size": self._max_batch_seen,
+                "queries_in_flight": self._heavy_in_flight,
+                "latency": {name: histogram.as_dict() for name, histogram in self._latency.items()}}
+
+
+########################################################################################
+# local HTTP server
+########################################################################################
+
+def _integer(value):
+    return None if value in (None, "") else int(value)
+
+
+def _boolean(value):
+    return value is None or value.lower() not in ("0", "false", "no")
+
+
+# path -> function(service, query parameters) returning a coroutine
+_ROUTES = {
+    "/ipa": lambda service, q: service.ipa(q["word"]),
+    "/rhyme": lambda service, q: service.rhyme(q["word"]),
+    "/meter": lambda service, q: service.meter(q["word"]),
+    "/syllables": lambda service, q: service.count_syllables(q["word"]),
+    "/analyze": lambda service, q: service.analyze(q["word"]),
+    "/rhymes": lambda service, q: service.rhymes(q["word"], q.get("lemma", ""), _integer(q.get("variation")) or 0),
+    "/same_syllables": lambda service, q: service.same_syllables(q["word"], q.get("lemma", ""),
+                                                                 _integer(q.get("variation")) or 0),
+    "/meters": lambda service, q: service.meters(q["word"], q.get("lemma", ""), _integer(q.get("variation")) or 0),
+    "/meters_like": lambda service, q: service.meters_like(q["pattern"], _boolean(q.get("levels")),
+                                                           _integer(q.get("limit")),
+                                                           _integer(q.get("offset")) or 0),
+    "/near_rhymes": lambda service, q: service.near_rhymes(q["word"], float(q.get("max_distance", 1)),
+                                                           _integer(q.get("limit", "20"))),
+    "/forms_of": lambda service, q: service.forms_of(q["lemma"]),
+}
+
+
+async def _respond(writer, status, body):
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    writer.write(("HTTP/1.1 %s\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: %d\r\n"
+                  "Connection: close\r\n\r\n" % (status, len(data))).encode("ascii") + data)
+    await writer.drain()
+
+
+# status and body of the response to a request
+async def _dispatch(service, reader):
+    try:
+        request = await reader.readline()
+        # headers are not needed
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        method, target, _ = request.decode("latin-1").split(" ", 2)
+    except ValueError:
+        # also raised by readline for lines longer than the limit of the stream
+        return "400 Bad Request", {"error": "malformed request"}
+    if method != "GET":
+        return "405 Method Not Allowed", {"error": "only GET is supported"}
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    if url.path == "/metrics":
+        return "200 OK", service.metrics()
+    route = _ROUTES.get(url.path)
+    if route is None:
+        return "404 Not Found", {"error": "unknown path %s" % url.path}
+    try:
+        result = await route(service, query)
+    except KeyError as error:
+        return "400 Bad Request", {"error": "missing parameter %s" % error}
+    except ValueError as error:
+        return "400 Bad Request", {"error": str(error)}
+    return "200 OK", {"result": result}
+
+
+async def _handle(service, reader, writer):
+    try:
+        try:
+            status, body = await _dispatch(service, reader)
+        except ConnectionError:
+            raise
+        except Exception as error:
+            # i.e. OverflowError of /near_rhymes?max_distance=inf, the connection is answered in any case
+            status, body = "500 Internal Server Error", {"error": "%s: %s" % (type(error).__name__, error)}
+        await _respond(writer, status, body)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+# The serve function runs a LookupService behind a local HTTP server until it is cancelled
+# input: host (string), port (integer), unix path (string, a Unix socket is used instead of TCP if given),
+#        options of LookupService
+async def serve(host="127.0.0.1", port=8080, path=None, **options):
+    async with LookupService(**options) as service:
+        handler = partial(_handle, service)
+        if path is not None:
+            server = await asyncio.start_unix_server(handler, path)
+        else:
+            server = await asyncio.start_server(handler, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m GERpronouncing.service",
+                                     description="serve pronounciation lookups over local HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--unix", default=None, help="path of a Unix socket to listen on instead of TCP")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-delay", type=float, default=MAX_DELAY)
+    parser.add_argument("--fallback", action="store_true", help="guess the pronounciation of unknown words")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, workers=args.workers, max_batch=args.max_batch,
+                          max_delay=args.max_delay, fallback=args.fallback))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
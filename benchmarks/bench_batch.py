@@ -0,0 +1,59 @@
+# Throughput of analyze_many compared to calling the functions for single words per token
+# usage: python benchmarks/bench_batch.py [--tokens N] [--vocabulary N]
+# The token stream is sampled from the lexicon with Zipf distributed frequencies (like real text)
+# plus 10% unknown tokens.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import GERpronouncing as gp
+
+
+def token_stream(count, vocabulary, seed=0):
+    rnd = random.Random(seed)
+    words = list(gp.words_dict)
+    words = rnd.sample(words, min(vocabulary, len(words)))
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    tokens = rnd.choices(words, weights, k=count)
+    for i in rnd.sample(range(count), count // 10):
+        tokens[i] = "xx%dxx" % rnd.randrange(count)
+    return tokens
+
+
+def per_word(tokens):
+    return {"ipa": [gp.ipa(token) for token in tokens],
+            "rhyme": [gp.rhyme(token) for token in tokens],
+            "meter": [gp.meter(token) for token in tokens],
+            "syllables": [gp.count_syllables(token) for token in tokens]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=200000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    gp.ipa("Haus")  # open the lexicon before timing
+    tokens = token_stream(args.tokens, args.vocabulary)
+
+    start = time.perf_counter()
+    expected = per_word(tokens)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = gp.analyze_many(tokens)
+    batch = time.perf_counter() - start
+
+    assert result == expected
+    print("tokens:       %d (%d distinct)" % (len(tokens), len(set(tokens))))
+    print("per word:     %.3fs  %10.0f tokens/s" % (single, len(tokens) / single))
+    print("analyze_many: %.3fs  %10.0f tokens/s  (%.1fx)" % (batch, len(tokens) / batch, single / batch))
+
+
+if __name__ == "__main__":
+    main()
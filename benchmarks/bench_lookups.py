@@ -0,0 +1,181 @@
+# Reproducible benchmark suite of the lexicon: import/load time, memory, per-call latency and batch throughput
+# usage: python benchmarks/bench_lookups.py [--calls N] [--tokens N] [--json PATH] [--baseline PATH]
+# Runs offline against the bundled data/de_ipa_wiktionary.zip. The words are sampled with a fixed seed, so runs on
+# different commits measure the same calls. Import time and memory are measured in fresh interpreters:
+#   import:   importing GERpronouncing
+#   load:     first lookup (opening the snapshot, which is rebuilt first if it is missing or outdated)
+#   build:    compiling the CSV into a snapshot (the dictionary build), written to a temporary file
+# With --json the results are written to a file, with --baseline the latencies are compared to such a file and the
+# script exits with status 1 if any median is more than --tolerance times slower.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import GERpronouncing as gp
+
+# measured in a fresh interpreter, prints a json dictionary
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import GERpronouncing as gp
+imported = time.perf_counter()
+gp.ipa("Haus")
+loaded = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+except ImportError:
+    rss = None
+print(json.dumps({"import_seconds": imported - start, "load_seconds": loaded - imported, "peak_rss_bytes": rss}))
+"""
+
+_BUILD_SCRIPT = """
+import json, sys, time
+from GERpronouncing.lexicon import build_snapshot
+start = time.perf_counter()
+build_snapshot(sys.argv[1])
+built = time.perf_counter()
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+except ImportError:
+    rss = None
+print(json.dumps({"build_seconds": built - start, "build_peak_rss_bytes": rss}))
+"""
+
+
+def run_script(script, *args):
+    output = subprocess.check_output([sys.executable, "-c", script] + list(args), cwd=ROOT)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def startup(repeat):
+    # the first run may rebuild the snapshot, so it is not counted
+    run_script(_IMPORT_SCRIPT)
+    runs = [run_script(_IMPORT_SCRIPT) for _ in range(repeat)]
+    result = {key: min(run[key] for run in runs) for key in ("import_seconds", "load_seconds")}
+    result["peak_rss_bytes"] = max(run["peak_rss_bytes"] or 0 for run in runs) or None
+    with tempfile.TemporaryDirectory() as directory:
+        result.update(run_script(_BUILD_SCRIPT, os.path.join(directory, "bench.lex")))
+    return result
+
+
+def percentiles(durations):
+    durations = sorted(durations)
+
+    def at(q):
+        return durations[min(int(q * len(durations)), len(durations) - 1)]
+
+    return {"calls": len(durations), "p50_us": at(0.5) * 1e6, "p90_us": at(0.9) * 1e6, "p99_us": at(0.99) * 1e6,
+            "max_us": durations[-1] * 1e6}
+
+
+# per-call latency of a function for every argument (every argument is timed once, in random order)
+def latency(function, arguments):
+    clock = time.perf_counter
+    durations = []
+    for argument in arguments:
+        start = clock()
+        function(argument)
+        durations.append(clock() - start)
+    return percentiles(durations)
+
+
+def sample(calls, seed=0):
+    rnd = random.Random(seed)
+    words = list(gp.words_dict)
+    words = [rnd.choice(words) for _ in range(calls)]
+    lemmas = [gp.lemmas(word)[0] for word in words]
+    meters = [gp.meter(word) for word in words]
+    # the same share of misses as in bench_batch.py
+    for i in rnd.sample(range(calls), calls // 10):
+        words[i] = "xx%dxx" % rnd.randrange(calls)
+    return words, lemmas, meters
+
+
+def lookups(calls):
+    words, lemmas, meters = sample(calls)
+    # result lists of rhymes and meters_like can be large, so they are called less often
+    heavy = max(calls // 10, 1)
+    return {"ipa": latency(gp.ipa, words),
+            "rhyme": latency(gp.rhyme, words),
+            "rhymes": latency(gp.rhymes, words[:heavy]),
+            "meter": latency(gp.meter, words),
+            "meters_like": latency(gp.meters_like, meters[:heavy]),
+            "meters_like_wildcard": latency(lambda meter: gp.meters_like("*" + meter[-2:], limit=100),
+                                            meters[:heavy]),
+            "possible_forms_of": latency(gp.possible_forms_of, lemmas)}
+
+
+def throughput(tokens):
+    words, _, _ = sample(tokens, seed=1)
+    start = time.perf_counter()
+    gp.analyze_many(words)
+    elapsed = time.perf_counter() - start
+    return {"tokens": len(words), "seconds": elapsed, "tokens_per_second": len(words) / elapsed}
+
+
+# names of latencies whose median got slower than tolerance times the baseline
+def regressions(result, baseline, tolerance):
+    slower = []
+    for name, values in result["latency"].items():
+        before = baseline.get("latency", {}).get(name)
+        if before and values["p50_us"] > tolerance * max(before["p50_us"], 1):
+            slower.append((name, before["p50_us"], values["p50_us"]))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--tokens", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3, help="number of fresh interpreters for the import time")
+    parser.add_argument("--skip-startup", action="store_true")
+    parser.add_argument("--json", default=None, help="write the results to a json file")
+    parser.add_argument("--baseline", default=None, help="json file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    result = {"python": sys.version.split()[0]}
+    if not args.skip_startup:
+        result["startup"] = startup(args.repeat)
+        for key, value in sorted(result["startup"].items()):
+            if value is None:
+                continue
+            print("%-22s %12.3f %s" % (key, value / 2 ** 20 if key.endswith("bytes") else value,
+                                       "MiB" if key.endswith("bytes") else "s"))
+
+    gp.ipa("Haus")  # open the lexicon before timing
+    result["latency"] = lookups(args.calls)
+    print("%-22s %8s %10s %10s %10s %10s" % ("function", "calls", "p50 µs", "p90 µs", "p99 µs", "max µs"))
+    for name, values in result["latency"].items():
+        print("%-22s %8d %10.2f %10.2f %10.2f %10.2f" % (name, values["calls"], values["p50_us"], values["p90_us"],
+                                                        values["p99_us"], values["max_us"]))
+
+    result["batch"] = throughput(args.tokens)
+    print("analyze_many           %8d tokens %10.0f tokens/s" % (result["batch"]["tokens"],
+                                                                result["batch"]["tokens_per_second"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(result, json.load(f), args.tolerance)
+        for name, before, after in slower:
+            print("regression: %s p50 %.2f µs -> %.2f µs" % (name, before, after))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Scaling of process_corpus with the number of worker processes
+# usage: python benchmarks/bench_parallel.py [--lines N] [--workers 1,2,4]
+# The corpus is generated from random words of the lexicon (8 words per line, every 5th line is blank).
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import GERpronouncing as gp
+
+
+def corpus(count, seed=0):
+    rnd = random.Random(seed)
+    words = list(gp.words_dict)
+    return ["" if i % 5 == 4 else " ".join(rnd.choices(words, k=8)) for i in range(count)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--workers", default=",".join(str(2 ** i) for i in range((os.cpu_count() or 1).bit_length())))
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    lines = corpus(args.lines)
+    expected = None
+    single = None
+    print("lines: %d, cpus: %d" % (len(lines), os.cpu_count() or 1))
+    for workers in [int(workers) for workers in args.workers.split(",")]:
+        gp.clear_oov_cache()
+        start = time.perf_counter()
+        result = list(gp.process_corpus(lines, workers=workers, chunk_size=args.chunk_size))
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected, single = result, elapsed
+        assert result == expected
+        print("workers %2d: %.2fs  %9.0f lines/s  speedup %.2fx" % (workers, elapsed, len(lines) / elapsed, single / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,6 @@ setuptools.setup(
         "Topic :: Scientific/Engineering :: Artificial Intelligence"
     ],
     include_package_data=True,
-    package_data={'': ['data/*.zip']},
-    python_requires='>=3.6',
+    package_data={'': ['data/*.zip', 'data/*.lex']},
+    python_requires='>=3.7',
 )